@@ -0,0 +1,417 @@
+"""Headless HTTP API over MultiProviderClient and the TTS service.
+
+A plain ASGI application with no web framework, so any ASGI server can host it
+and a request costs only what the providers themselves cost:
+
+    pip install uvicorn
+    python api.py --port 8000 --workers 4      (or: uvicorn api:app --port 8000)
+
+    POST /v1/chat    {"provider", "model", "messages", "params"?, "session"?}
+                     Server-Sent Events: "chunk" events with {"text"}, then one "done"
+                     event with the usage, or an "error" event if the stream fails
+    POST /v1/speech  {"text", "model"?, "voice"?, "format"?, "speed"?}
+                     the audio, streamed with chunked transfer encoding
+    GET  /healthz    status and configured providers
+    GET  /metrics    Prometheus text; /metrics.json for the JSON export
+
+Chat for a single model runs natively on the server's event loop with the
+pooled async clients and the shared rate limit governor. Auto routing and
+hedging, which are built on the synchronous generators, run those on worker
+threads instead.
+"""
+import os
+import re
+import json
+import asyncio
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from import_timer import ImportTimer
+
+with ImportTimer("api.py") as imports:
+    with imports.module("chat_clients"):
+        from chat_clients import MultiProviderClient
+    with imports.module("tts"):
+        from tts import SpeechSettings, TTSService, get_tts_service
+from client_pool import get_client_pool
+from governor import GovernorTimeout
+from model_router import AUTO_PROVIDER
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Same defaults as a fresh chat session in the UI; requests override any of them
+DEFAULT_PARAMS = {
+    "max_tokens_checkbox": True,
+    "temperature_checkbox": False,
+    "top_p_checkbox": False,
+    "top_k_checkbox": False,
+    "max_tokens": 5000,
+    "temperature": 0.0,
+    "top_p": 0.0,
+    "top_k": 0,
+    "summarize_context": False,
+    "response_cache": False,
+    "ttft_target": None,
+    "hedge": False,
+    "hedge_backup": None,
+    "hedge_delay": 0.0,
+}
+AUDIO_CONTENT_TYPES = {
+    "mp3": "audio/mpeg", "opus": "audio/ogg", "aac": "audio/aac",
+    "flac": "audio/flac", "wav": "audio/wav", "pcm": "audio/pcm",
+}
+MESSAGE_ROLES = ("system", "developer", "user", "assistant")
+# data:<mime>;base64,<payload>, the only shape split_data_url and the providers accept
+DATA_URL_PATTERN = re.compile(r"data:[\w.+-]+/[\w.+-]+;base64,[A-Za-z0-9+/]+={0,2}")
+MAX_BODY_BYTES = int(os.getenv("API_MAX_BODY_BYTES", 1024 * 1024))
+_end = object()
+
+_stream_executor = None
+_stream_executor_lock = threading.Lock()
+
+
+def get_stream_executor():
+    """Threads for the synchronous streams, kept apart from the loop's default executor.
+
+    A stream holds its thread for as long as it runs, including governor
+    waits, so sharing the default executor would let a handful of Auto or
+    hedged streams starve every to_thread call on the server.
+    """
+    global _stream_executor
+    with _stream_executor_lock:
+        if _stream_executor is None:
+            _stream_executor = ThreadPoolExecutor(max_workers=int(os.getenv("API_STREAM_WORKERS", 32)),
+                                                  thread_name_prefix="api-stream")
+        return _stream_executor
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Client disconnected")
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request body is larger than {MAX_BODY_BYTES} bytes")
+        if not message.get("more_body"):
+            break
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Request body is not valid JSON")
+    if not isinstance(request, dict):
+        raise HTTPError(400, "Request body must be a JSON object")
+    return request
+
+
+async def send_response(send, status, body, content_type="application/json", headers=None):
+    if not isinstance(body, bytes):
+        body = (json.dumps(body) if content_type == "application/json" else body).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+                   + [(name.encode(), str(value).encode()) for name, value in (headers or {}).items()],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def iterate_in_thread(generator):
+    """Drives a synchronous generator from worker threads, one next() per chunk."""
+    loop = asyncio.get_running_loop()
+    executor = get_stream_executor()
+    pending = None
+    try:
+        while True:
+            pending = loop.run_in_executor(executor, next, generator, _end)
+            # Shielded so a cancelled request still lets the thread finish before close()
+            chunk = await asyncio.shield(pending)
+            if chunk is _end:
+                return
+            yield chunk
+    finally:
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending])
+        # Closing runs the generator's cleanup, which cancels its provider request
+        await loop.run_in_executor(executor, generator.close)
+
+
+async def stream_response(send, receive, stream, content_type, encode, headers=None, on_error=None):
+    """Streams chunks until the stream ends or the client goes away.
+
+    The first chunk is awaited before the response starts, so a request that
+    fails up front (rate limited, bad model) still gets a proper status code.
+    """
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+
+    async def next_chunk():
+        chunk = asyncio.ensure_future(stream.__anext__())
+        await asyncio.wait({chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        if not chunk.done():
+            # Cancelling mid-request closes the provider connection instead of paying for unread tokens
+            chunk.cancel()
+            await asyncio.gather(chunk, return_exceptions=True)
+            return _end
+        try:
+            return chunk.result()
+        except StopAsyncIteration:
+            return _end
+
+    try:
+        try:
+            first = await next_chunk()
+        except GovernorTimeout as e:
+            raise HTTPError(429, str(e), {"retry-after": 5})
+        except HTTPError:
+            raise
+        except Exception as e:
+            raise HTTPError(502, f"{type(e).__name__}: {e}")
+        if disconnected.done():
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", content_type.encode()), (b"cache-control", b"no-cache"),
+                        # Reverse proxies must not buffer the stream
+                        (b"x-accel-buffering", b"no")]
+                       + [(name.encode(), str(value).encode()) for name, value in (headers or {}).items()],
+        })
+        chunk = first
+        try:
+            while chunk is not _end:
+                await send({"type": "http.response.body", "body": encode(chunk), "more_body": True})
+                chunk = await next_chunk()
+        except Exception as e:
+            # Headers are gone already; report in-band if the format allows it
+            logger.warning("Stream failed after the response started: %s", e)
+            if on_error is None:
+                raise
+            await send({"type": "http.response.body", "body": on_error(e), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+    finally:
+        disconnected.cancel()
+        await stream.aclose()
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+def validate_content_item(item):
+    """Accepts only content that carries its own bytes.
+
+    image_ref items and image paths are resolved against the server's disk, so
+    they are never taken from a request.
+    """
+    if not isinstance(item, dict):
+        raise HTTPError(400, "content items must be objects")
+    kind = item.get("type")
+    if kind == "text":
+        valid = isinstance(item.get("text"), str)
+    elif kind == "image_url":
+        url = item.get("image_url")
+        valid = isinstance(url, dict) and isinstance(url.get("url"), str) and DATA_URL_PATTERN.fullmatch(url["url"])
+    elif kind == "image":
+        source = item.get("source")
+        valid = (isinstance(source, dict) and source.get("type") == "base64"
+                 and isinstance(source.get("media_type"), str) and isinstance(source.get("data"), str))
+    else:
+        raise HTTPError(400, f"Unsupported content type: {kind}")
+    if not valid:
+        raise HTTPError(400, f"Malformed {kind} content item")
+
+
+def validate_messages(messages):
+    if not isinstance(messages, list) or not messages:
+        raise HTTPError(400, "messages must be a non-empty list")
+    for message in messages:
+        if not isinstance(message, dict) or message.get("role") not in MESSAGE_ROLES:
+            raise HTTPError(400, f"Each message needs a role out of {', '.join(MESSAGE_ROLES)}")
+        content = message.get("content")
+        if isinstance(content, list) and message["role"] in ("user", "assistant"):
+            for item in content:
+                validate_content_item(item)
+        elif not isinstance(content, str):
+            raise HTTPError(400, "message content must be a string, or a list of content items for user and assistant turns")
+
+
+async def chat(scope, receive, send):
+    request = await read_json(receive)
+    provider, model = request.get("provider"), request.get("model")
+    messages = request.get("messages")
+    if not isinstance(provider, str) or not isinstance(model, (str, type(None))):
+        raise HTTPError(400, "provider and model must be strings")
+    if provider != AUTO_PROVIDER and model not in MultiProviderClient.models.get(provider, {}).values():
+        raise HTTPError(400, f"Unknown provider/model: {provider}/{model}")
+    validate_messages(messages)
+    params = request.get("params") or {}
+    if not isinstance(params, dict):
+        raise HTTPError(400, "params must be an object")
+    params = dict(DEFAULT_PARAMS, **params)
+    for name, default in DEFAULT_PARAMS.items():
+        value = params[name]
+        if isinstance(default, bool):
+            if not isinstance(value, bool):
+                raise HTTPError(400, f"params.{name} must be true or false")
+        elif isinstance(default, (int, float)):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise HTTPError(400, f"params.{name} must be a number")
+    if not isinstance(params["max_tokens"], int) or params["max_tokens"] < 1:
+        raise HTTPError(400, "params.max_tokens must be a positive integer")
+    if params["hedge_delay"] < 0:
+        raise HTTPError(400, "params.hedge_delay must not be negative")
+    ttft_target = params["ttft_target"]
+    if ttft_target is not None and (isinstance(ttft_target, bool) or not isinstance(ttft_target, (int, float))
+                                    or ttft_target <= 0):
+        raise HTTPError(400, "params.ttft_target must be a positive number or null")
+    backup = params["hedge_backup"]
+    if backup is not None and not (
+        isinstance(backup, list) and len(backup) == 2 and all(isinstance(part, str) for part in backup)
+        and backup[1] in MultiProviderClient.models.get(backup[0], {}).values()
+    ):
+        raise HTTPError(400, "params.hedge_backup must be a known [provider, model] pair or null")
+    session = request.get("session") or "api"
+    if not isinstance(session, str):
+        raise HTTPError(400, "session must be a string")
+
+    # The session keys the governor's fair queueing; callers without one share a queue
+    client = MultiProviderClient(session)
+    usage = {}
+    if provider == AUTO_PROVIDER or params.get("hedge"):
+        stream = iterate_in_thread(client.send_message(messages, provider, model, params, usage=usage))
+    else:
+        stream = client.stream_async(messages, provider, model, params, usage=usage)
+
+    async def events():
+        try:
+            async for text in stream:
+                yield sse_event("chunk", {"text": text})
+            # usage is filled in once the provider's stream has ended
+            yield sse_event("done", usage)
+        finally:
+            await stream.aclose()
+
+    await stream_response(
+        send, receive, events(), "text/event-stream", lambda event: event,
+        on_error=lambda e: sse_event("error", {"error": f"{type(e).__name__}: {e}"})
+    )
+
+
+async def speech(scope, receive, send):
+    request = await read_json(receive)
+    defaults = SpeechSettings()
+    settings = SpeechSettings(
+        request.get("model", defaults.model), request.get("voice", defaults.voice),
+        request.get("format", defaults.format), request.get("speed", defaults.speed),
+    )
+    text = request.get("text")
+    if not text or not isinstance(text, str):
+        raise HTTPError(400, "text is required")
+    for name, options in (("model", TTSService.models), ("voice", TTSService.voices), ("format", TTSService.formats)):
+        if not isinstance(getattr(settings, name), str) or getattr(settings, name) not in options:
+            raise HTTPError(400, f"Unknown {name}: {getattr(settings, name)}")
+    # bool is an int subclass, but true/false is not a speed
+    if isinstance(settings.speed, bool) or not isinstance(settings.speed, (int, float)):
+        raise HTTPError(400, "speed must be a number")
+    settings = settings._replace(speed=float(settings.speed))
+    if not 0.25 <= settings.speed <= 4.0:
+        raise HTTPError(400, "speed must be between 0.25 and 4.0")
+
+    tts = get_tts_service()
+    path = tts.output_path(settings)
+    if len(text) <= tts.input_limit:
+        stream = iterate_in_thread(tts.stream_speech(text, settings, path=path))
+    else:
+        # Long texts are synthesized in parallel chunks, so only the finished file can be streamed
+        path = await asyncio.get_running_loop().run_in_executor(
+            get_stream_executor(), tts.create_long_speech, text, settings, path)
+        stream = iterate_in_thread(read_file(path))
+    await stream_response(send, receive, stream, AUDIO_CONTENT_TYPES[settings.format], lambda chunk: chunk)
+
+
+def read_file(path, chunk_size=64 * 1024):
+    with open(path, "rb") as audio_file:
+        while chunk := audio_file.read(chunk_size):
+            yield chunk
+
+
+async def healthz(scope, receive, send):
+    await send_response(send, 200, {"status": "ok", "providers": get_client_pool().configured_providers()})
+
+
+async def metrics(scope, receive, send):
+    await send_response(send, 200, get_telemetry().to_prometheus(), "text/plain; version=0.0.4")
+
+
+async def metrics_json(scope, receive, send):
+    await send_response(send, 200, get_telemetry().to_json().encode("utf-8"))
+
+
+ROUTES = {
+    ("POST", "/v1/chat"): chat,
+    ("POST", "/v1/speech"): speech,
+    ("GET", "/healthz"): healthz,
+    ("GET", "/metrics"): metrics,
+    ("GET", "/metrics.json"): metrics_json,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if os.getenv("PROVIDER_POOL_WARM_UP") == "1":
+                get_client_pool().warm_up_in_background()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    path = scope["path"].rstrip("/") or "/"
+    handler = ROUTES.get((scope["method"], path))
+    try:
+        if handler is None:
+            allowed = [method for method, route in ROUTES if route == path]
+            raise HTTPError(405, f"Use {', '.join(allowed)}") if allowed else HTTPError(404, f"No route for {path}")
+        await handler(scope, receive, send)
+    except HTTPError as e:
+        await send_response(send, e.status, {"error": str(e)}, headers=e.headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        parser.exit(1, "uvicorn is required to serve the API: pip install uvicorn\n")
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Latency and throughput benchmark over MultiProviderClient.models.
+
+Runs a prompt set against any subset of models through the same streaming
+generators the chat uses and records, per request, time-to-first-token,
+inter-chunk gaps, output tokens/sec, total latency and errors. Results are
+written as per-request CSV rows and a JSON summary with percentiles.
+
+    python benchmark.py --models "OpenAI:gpt-4o-mini" "Anthropic:Claude-3 Haiku" \\
+        --prompts prompts.txt --repeat 3 --concurrency 4 --csv runs.csv --json summary.json
+
+--stand-in runs against a local fake provider so the harness works offline.
+"""
+import csv
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from context_window import count_tokens
+from telemetry import percentile
+from chat_clients import MultiProviderClient
+from model_router import AUTO_PROVIDER
+
+DEFAULT_PROMPTS = [
+    "Say hello in one short sentence.",
+    "Explain the difference between a process and a thread in three sentences.",
+    "Write a 200 word story about a lighthouse keeper.",
+]
+
+DEFAULT_PARAMS = {
+    "max_tokens_checkbox": True,
+    "temperature_checkbox": False,
+    "top_p_checkbox": False,
+    "top_k_checkbox": False,
+    "max_tokens": 512,
+    "temperature": 0.0,
+    "top_p": 0.0,
+    "top_k": 0,
+}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class StandInProvider:
+    """Offline stand-in with MultiProviderClient's interface and a fake token stream."""
+
+    models = MultiProviderClient.models
+
+    def __init__(self, ttft=0.3, tokens_per_second=60.0, output_tokens=120, error_rate=0.0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+
+    def send_message(self, messages, provider, model, params, image_path=None, usage=None):
+        time.sleep(self.ttft)
+        if random.random() < self.error_rate:
+            raise RuntimeError("stand-in provider error")
+        for index in range(self.output_tokens):
+            if index:
+                time.sleep(1 / self.tokens_per_second)
+            yield "token "
+        if usage is not None:
+            usage.update({"input_tokens": sum(count_tokens(str(m["content"])) for m in messages),
+                          "output_tokens": self.output_tokens})
+
+
+def resolve_targets(client, selections):
+    """Maps "Provider:label-or-id" selections (default: every model) to (provider, label, model_id).
+
+    "Auto" benchmarks the router as if it were one more model.
+    """
+    targets = []
+    for provider, models in client.models.items():
+        for label, model_id in models.items():
+            if not selections or any(
+                selection in (f"{provider}:{label}", f"{provider}:{model_id}") for selection in selections
+            ):
+                targets.append((provider, label, model_id))
+    if selections and AUTO_PROVIDER in selections:
+        targets.append((AUTO_PROVIDER, AUTO_PROVIDER, AUTO_PROVIDER))
+    if selections and not targets:
+        raise SystemExit(f"No models match {selections}")
+    return targets
+
+
+def run_request(client, provider, label, model_id, prompt, params):
+    usage = {}
+    row = {"provider": provider, "model": label, "model_id": model_id, "prompt": prompt[:60],
+           "ttft": None, "total": None, "output_tokens": None, "tokens_per_second": None,
+           "chunks": 0, "gaps": [], "error": None}
+    started = time.perf_counter()
+    last = None
+    text = []
+    try:
+        for chunk in client.send_message([{"role": "user", "content": prompt}], provider, model_id, params, usage=usage):
+            now = time.perf_counter()
+            if last is None:
+                row["ttft"] = now - started
+            else:
+                row["gaps"].append(now - last)
+            last = now
+            text.append(chunk)
+            row["chunks"] += 1
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["total"] = time.perf_counter() - started
+    if not row["error"]:
+        row["output_tokens"] = usage.get("output_tokens") or count_tokens("".join(text))
+        generating = row["total"] - (row["ttft"] or 0)
+        row["tokens_per_second"] = row["output_tokens"] / generating if generating > 0 else None
+    return row
+
+
+def summarize(rows):
+    summary = {}
+    for row in rows:
+        summary.setdefault(f"{row['provider']}:{row['model']}", []).append(row)
+    result = {}
+    for key, model_rows in summary.items():
+        ok = [row for row in model_rows if not row["error"]]
+        gaps = [gap for row in ok for gap in row["gaps"]]
+        metrics = {
+            "ttft": [row["ttft"] for row in ok if row["ttft"] is not None],
+            "total": [row["total"] for row in ok],
+            "tokens_per_second": [row["tokens_per_second"] for row in ok if row["tokens_per_second"]],
+            "inter_chunk_gap": gaps,
+        }
+        result[key] = {
+            "requests": len(model_rows),
+            "errors": len(model_rows) - len(ok),
+            "error_rate": (len(model_rows) - len(ok)) / len(model_rows),
+            **{
+                name: {f"p{q}": percentile(values, q) for q in PERCENTILES} | {"mean": sum(values) / len(values) if values else None}
+                for name, values in metrics.items()
+            },
+        }
+    return result
+
+
+def run_benchmark(client, targets, prompts, params, repeat=1, concurrency=4):
+    jobs = [(provider, label, model_id, prompt)
+            for _ in range(repeat) for provider, label, model_id in targets for prompt in prompts]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_request, client, *job, params) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def write_csv(path, rows):
+    fields = ["provider", "model", "model_id", "prompt", "ttft", "total", "output_tokens",
+              "tokens_per_second", "chunks", "gap_p50", "gap_p95", "gap_max", "error"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(row, gap_p50=percentile(row["gaps"], 50), gap_p95=percentile(row["gaps"], 95),
+                                 gap_max=max(row["gaps"], default=None)))
+
+
+def load_prompts(path):
+    if not path:
+        return DEFAULT_PROMPTS
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["prompt"] for line in f if line.strip()]
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="*", help='"Provider:label", "Provider:model_id" or "Auto"; defaults to all')
+    parser.add_argument("--prompts", help=".txt (one prompt per line) or .jsonl with a \"prompt\" field")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_PARAMS["max_tokens"])
+    parser.add_argument("--csv", help="write per-request rows here")
+    parser.add_argument("--json", help="write the summary (and rows) here")
+    parser.add_argument("--stand-in", action="store_true", help="use the offline stand-in provider")
+    parser.add_argument("--stand-in-ttft", type=float, default=0.3)
+    parser.add_argument("--stand-in-rate", type=float, default=60.0, help="stand-in tokens per second")
+    args = parser.parse_args()
+
+    client = StandInProvider(args.stand_in_ttft, args.stand_in_rate) if args.stand_in else MultiProviderClient()
+    params = dict(DEFAULT_PARAMS, max_tokens=args.max_tokens)
+    targets = resolve_targets(client, args.models)
+    rows = run_benchmark(client, targets, load_prompts(args.prompts), params, args.repeat, args.concurrency)
+    summary = summarize(rows)
+
+    if args.csv:
+        write_csv(args.csv, rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "requests": rows}, f, indent=2)
+    for key, stats in summary.items():
+        print(f"{key}: n={stats['requests']} errors={stats['error_rate']:.0%} "
+              f"ttft p50={stats['ttft']['p50']} p95={stats['ttft']['p95']} "
+              f"tok/s p50={stats['tokens_per_second']['p50']}")
+
+
+if __name__ == "__main__":
+    main()
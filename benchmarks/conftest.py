@@ -0,0 +1,98 @@
+"""Fixtures for the request pipeline benchmarks.
+
+Everything runs offline: provider clients are pointed at mock_providers.py and
+the blob store, caches and logs live in a temporary directory.
+"""
+import io
+import os
+import random
+import pytest
+from PIL import Image
+import client_pool
+from mock_providers import MockProviderServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def mock_server(tmp_path_factory):
+    server = MockProviderServer(output_tokens=4096).start()
+    with pytest.MonkeyPatch.context() as patch:
+        # Keep blobs, caches and chat logs out of the working tree
+        patch.chdir(tmp_path_factory.mktemp("workdir"))
+        patch.setenv("OPENAI_API_KEY", "mock")
+        patch.setenv("ANTHROPIC_API_KEY", "mock")
+        patch.setenv("OPENAI_BASE_URL", server.base_urls["OpenAI"])
+        patch.setenv("ANTHROPIC_BASE_URL", server.base_urls["Anthropic"])
+        patch.setattr(client_pool, "_pool", client_pool.ClientPool(base_urls=server.base_urls))
+        yield server
+    server.stop()
+
+
+@pytest.fixture
+def client():
+    from chat_clients import MultiProviderClient
+    return MultiProviderClient()
+
+
+@pytest.fixture
+def params():
+    return {
+        "max_tokens_checkbox": True,
+        "temperature_checkbox": False,
+        "top_p_checkbox": False,
+        "top_k_checkbox": False,
+        "max_tokens": 1024,
+        "temperature": 0.0,
+        "top_p": 0.0,
+        "top_k": 0,
+        "summarize_context": False,
+        "response_cache": False,
+    }
+
+
+def history(turns, words_per_turn=120, images=0):
+    """A system prompt plus alternating user/assistant turns; the first `images` user turns carry an image ref."""
+    from blob_store import get_blob_store
+    rng = random.Random(turns)
+    vocabulary = ["alpha", "beta", "gamma", "delta", "latency", "token", "stream", "cache", "window"]
+    messages = [{"role": "developer", "content": "You are a helpful assistant."}]
+    for index in range(turns):
+        role = "user" if index % 2 == 0 else "assistant"
+        text = " ".join(rng.choice(vocabulary) for _ in range(words_per_turn))
+        if role == "user" and index // 2 < images:
+            image = image_bytes(256, 256, seed=index)
+            content = [{"type": "text", "text": text}, get_blob_store().reference(image, "image/png")]
+            messages.append({"role": role, "content": content})
+        else:
+            messages.append({"role": role, "content": text})
+    messages.append({"role": "user", "content": "And one more question?"})
+    return messages
+
+
+def image_bytes(width, height, seed=0):
+    # Noise compresses poorly, so the PNG is close to its worst-case size
+    image = Image.frombytes("RGB", (width, height), random.Random(seed).randbytes(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def make_history():
+    return history
+
+
+@pytest.fixture
+def large_image(tmp_path):
+    path = tmp_path / "large.png"
+    path.write_bytes(image_bytes(2048, 1536))
+    return str(path)
+
+
+@pytest.fixture
+def app():
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=60)
+    app.run()
+    return app
@@ -0,0 +1,32 @@
+"""The headless API driven in-process through httpx's ASGI transport, without a server in between."""
+import asyncio
+import httpx
+import pytest
+import api
+
+
+def run_requests(requests):
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://api") as session:
+            return await asyncio.gather(*(session.post(path, json=body) for path, body in requests))
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("concurrency", [1, 16])
+def test_chat_sse(benchmark, params, concurrency):
+    body = {
+        "provider": "OpenAI", "model": "gpt-4o-mini", "session": "benchmark",
+        "messages": [{"role": "user", "content": "Stream please."}], "params": dict(params, max_tokens=500),
+    }
+    responses = benchmark.pedantic(run_requests, args=([("/v1/chat", body)] * concurrency,), rounds=5, warmup_rounds=1)
+    for response in responses:
+        assert response.status_code == 200
+        assert response.text.rstrip().split("\n\n")[-1].startswith("event: done")
+
+
+def test_speech_stream(benchmark):
+    body = {"text": " ".join(["word"] * 200), "format": "pcm"}
+    responses = benchmark.pedantic(run_requests, args=([("/v1/speech", body)] * 4,), rounds=5, warmup_rounds=1)
+    assert all(response.status_code == 200 and response.content for response in responses)
@@ -0,0 +1,28 @@
+"""AudioCombiner.mix_audio_files on PCM clips, which need no ffmpeg."""
+import numpy as np
+from tts import AudioCombiner
+
+
+def mix(tmp_path, lengths, crossfade_ms=150):
+    combiner = AudioCombiner(str(tmp_path))
+    for index, length in enumerate(lengths):
+        np.full(length, 8000, dtype="<i2").tofile(tmp_path / f"clip{index}.pcm")
+        combiner.audio_files.append((f"clip{index}.pcm", index))
+    combiner.mix_audio_files("mixed.pcm", trim=False, crossfade_ms=crossfade_ms)
+    return np.fromfile(tmp_path / "mixed.pcm", dtype="<i2")
+
+
+def test_very_short_clip_between_long_ones(tmp_path):
+    # 100 samples is far shorter than the two 3600-sample crossfades around it
+    output = mix(tmp_path, [24000, 100, 24000])
+    assert len(output) == 24000 + 100 + 24000 - 50 - 50
+    # Equal-power fades of two equal constant clips peak at sqrt(2) times the
+    # level; overlapping fades within the short clip would stack beyond that
+    level = 32768 * 10 ** (-20 / 20)
+    assert output.max() <= level * np.sqrt(2) + 1
+    assert output.min() >= level - 1
+
+
+def test_long_clips_use_the_full_crossfade(tmp_path):
+    output = mix(tmp_path, [24000, 24000, 24000])
+    assert len(output) == 3 * 24000 - 2 * 3600
@@ -0,0 +1,97 @@
+"""Behaviour of the rate limit governor against a mock server that enforces a quota with 429s.
+
+Each test gets its own quota-limited server and Governor, so the shared
+benchmark server and the process-wide governor are left alone.
+"""
+import time
+import threading
+import pytest
+from client_pool import ClientPool
+from governor import Governor
+from mock_providers import MockProviderServer
+
+
+@pytest.fixture
+def quota_server():
+    server = MockProviderServer(requests_per_minute=120).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def openai_client(quota_server):
+    return ClientPool(base_urls=quota_server.base_urls).create_client("OpenAI")
+
+
+def speak(client):
+    return client.audio.speech.create(model="tts-1", voice="nova", input="one two", response_format="pcm")
+
+
+def run_concurrently(governor, client, count, session="default"):
+    errors = []
+
+    def request():
+        try:
+            with governor.request("OpenAI", "tts-1", session) as permit:
+                permit.call(speak, client)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    return errors
+
+
+def test_throttled_requests_are_retried_until_they_succeed(quota_server, openai_client):
+    quota_server.allowance = 0  # the quota is spent, so the first burst is rejected
+    governor = Governor(initial_limit=8, max_retries=8, max_backoff=1)
+    errors = run_concurrently(governor, openai_client, 6)
+    assert errors == []
+    assert quota_server.rejected > 0
+    # Every request eventually got through: 6 successes on top of the rejections
+    assert quota_server.requests - quota_server.rejected == 6
+    assert governor.stats()["OpenAI:tts-1"]["throttled"] > 0
+
+
+def test_throttling_shrinks_the_concurrency_limit(quota_server, openai_client):
+    quota_server.allowance = 0
+    governor = Governor(initial_limit=8, max_retries=8, max_backoff=1)
+    assert run_concurrently(governor, openai_client, 4) == []
+    stats = governor.stats()["OpenAI:tts-1"]
+    assert stats["limit"] < 8
+    # The quota learned from the 429's headers now paces requests instead of the server rejecting them
+    assert stats["requests_remaining"] is not None
+
+
+def test_sessions_are_served_in_turn(quota_server, openai_client):
+    governor = Governor(initial_limit=1, max_limit=1)
+    model = governor.get("OpenAI", "tts-1")
+    order = []
+
+    def request(session):
+        with governor.request("OpenAI", "tts-1", session) as permit:
+            order.append(session)
+            permit.call(speak, openai_client)
+
+    def wait_until_queued(count):
+        deadline = time.monotonic() + 10
+        while model.stats()["queued"] < count:
+            assert time.monotonic() < deadline, "requests never reached the queue"
+            time.sleep(0.01)
+
+    # Hold the only slot so the busy session's backlog and the other session's request all queue
+    holder = governor.request("OpenAI", "tts-1", "busy").__enter__()
+    threads = []
+    for index, session in enumerate(["busy"] * 4 + ["quiet"]):
+        threads.append(threading.Thread(target=request, args=(session,)))
+        threads[-1].start()
+        wait_until_queued(index + 1)
+    holder.release()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    # Round robin: the quiet session goes right after the busy session's next request, not after its whole backlog
+    assert order == ["busy", "quiet", "busy", "busy", "busy"]
@@ -0,0 +1,48 @@
+"""Per-turn overhead before a request leaves the process: windowing, formatting and image encoding."""
+import pytest
+from image_cache import ImageCache
+
+PROVIDER_MODELS = [("OpenAI", "gpt-4o-mini"), ("Anthropic", "claude-3-5-haiku-20241022")]
+
+
+@pytest.mark.parametrize("provider,model", PROVIDER_MODELS)
+@pytest.mark.parametrize("turns", [10, 200, 1000])
+def test_build_request_long_history(benchmark, client, params, make_history, provider, model, turns):
+    messages = make_history(turns)
+    provider_client = client.get_client(provider)
+    request = benchmark(provider_client.build_request, messages, model, params)
+    assert request["messages"]
+
+
+@pytest.mark.parametrize("provider,model", PROVIDER_MODELS)
+def test_build_request_with_image_refs(benchmark, client, params, make_history, provider, model):
+    messages = make_history(40, images=20)
+    provider_client = client.get_client(provider)
+    benchmark(provider_client.build_request, messages, model, params)
+
+
+@pytest.mark.parametrize("turns", [200, 1000])
+def test_window_messages(benchmark, client, params, make_history, turns):
+    messages = make_history(turns)
+    windowed = benchmark(client.window_messages, messages, "OpenAI", "gpt-4o-mini", params)
+    assert len(windowed) <= len(messages)
+
+
+def test_window_messages_cold_token_counts(benchmark, client, params, make_history):
+    # Counts are cached on the messages, so the first turn of a session pays for all of them
+    benchmark.pedantic(
+        client.window_messages,
+        setup=lambda: ((make_history(1000), "OpenAI", "gpt-4o-mini", params), {}),
+        rounds=5,
+    )
+
+
+@pytest.mark.parametrize("provider", ["OpenAI", "Anthropic"])
+def test_encode_large_image_cached(benchmark, client, large_image, provider):
+    provider_client = client.get_client(provider)
+    provider_client.encode_image(large_image)
+    benchmark(provider_client.encode_image, large_image)
+
+
+def test_encode_large_image_cold(benchmark, large_image):
+    benchmark.pedantic(lambda cache: cache.encode_file(large_image), setup=lambda: ((ImageCache(),), {}), rounds=10)
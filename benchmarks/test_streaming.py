@@ -0,0 +1,85 @@
+"""Streaming overhead against the mock providers, which send tokens as fast as the client reads them."""
+import pytest
+from main import StreamingRenderer
+
+PROVIDER_MODELS = [("OpenAI", "gpt-4o-mini"), ("Anthropic", "claude-3-5-haiku-20241022")]
+
+
+class Placeholder:
+    """Stands in for st.empty(); only counts redraws."""
+
+    def __init__(self):
+        self.draws = 0
+
+    def markdown(self, body):
+        self.draws += 1
+
+
+@pytest.mark.parametrize("provider,model", PROVIDER_MODELS)
+@pytest.mark.parametrize("tokens", [64, 4000])
+def test_stream_response(benchmark, client, params, provider, model, tokens):
+    params = dict(params, max_tokens=tokens)
+    messages = [{"role": "user", "content": "Stream please."}]
+
+    def stream():
+        usage = {}
+        text = "".join(client.send_message(messages, provider, model, params, usage=usage))
+        return text, usage
+
+    text, usage = benchmark.pedantic(stream, rounds=5, warmup_rounds=1)
+    assert usage["output_tokens"] == tokens
+    assert text
+
+
+def test_fan_out(benchmark, client, params):
+    params = dict(params, max_tokens=1000)
+    messages = [{"role": "user", "content": "Compare yourselves."}]
+    targets = [("OpenAI", "gpt-4o-mini"), ("OpenAI", "gpt-4o"), ("Anthropic", "claude-3-5-haiku-20241022")]
+    events = benchmark.pedantic(lambda: list(client.send_message_fan_out(messages, targets, params)),
+                                rounds=5, warmup_rounds=1)
+    assert not [event for event in events if event[1] == "error"]
+
+
+def test_hedged_stream(benchmark, client, params):
+    # The primary always answers first here, so this is the cost of routing a stream through the race
+    params = dict(params, max_tokens=1000, hedge=True, hedge_backup=("Anthropic", "claude-3-5-haiku-20241022"),
+                  hedge_delay=5.0)
+    messages = [{"role": "user", "content": "Hedge me."}]
+
+    def stream():
+        usage = {}
+        "".join(client.send_message(messages, "OpenAI", "gpt-4o-mini", params, usage=usage))
+        return usage
+
+    usage = benchmark.pedantic(stream, rounds=5, warmup_rounds=1)
+    assert usage["hedge"]["winner"] == "primary"
+
+
+@pytest.mark.parametrize("interval", [0.0, 0.1])
+def test_streaming_renderer(benchmark, interval):
+    chunks = [" token"] * 20000
+
+    def render():
+        renderer = StreamingRenderer(Placeholder(), interval=interval)
+        for chunk in chunks:
+            renderer.write(chunk)
+        return renderer.finish()
+
+    benchmark.pedantic(render, rounds=5)
+
+
+@pytest.mark.parametrize("turns", [0, 200])
+def test_render_chat_turn(benchmark, app, make_history, turns):
+    # A full Streamlit script run: history rendering plus one streamed reply
+    history = make_history(turns)
+
+    def setup():
+        app.session_state["messages"] = list(history)
+        return (), {}
+
+    def turn():
+        app.chat_input[0].set_value("Hello?").run()
+
+    benchmark.pedantic(turn, setup=setup, rounds=3)
+    assert not app.exception
+    assert app.session_state["messages"][-1]["role"] == "assistant"
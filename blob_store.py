@@ -0,0 +1,71 @@
+import os
+import re
+import mmap
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+DIGEST_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class BlobStore:
+    """Content-addressed file store for uploaded images.
+
+    Session history keeps only a small reference ({"type": "image_ref", ...});
+    the bytes live on local disk and are memory-mapped when a request or the
+    page actually needs them, so per-session memory does not grow with images.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or os.getenv("BLOB_STORE_DIR", Path.cwd() / "blobs"))
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest):
+        # Digests come from session history and API requests; anything else could name a file outside the store
+        if not isinstance(digest, str) or not DIGEST_PATTERN.fullmatch(digest):
+            raise ValueError(f"Not a blob digest: {digest!r}")
+        return self.root / digest[:2] / digest
+
+    def exists(self, digest):
+        return self.path(digest).exists()
+
+    def put(self, data):
+        """Stores the bytes once and returns their SHA-256 digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial blob
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    @contextmanager
+    def open(self, digest):
+        """Yields a read-only memory map of the blob."""
+        with open(self.path(digest), "rb") as blob_file:
+            if os.fstat(blob_file.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(blob_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def reference(self, data, media_type):
+        """Stores image bytes and returns the content item kept in session history."""
+        return {"type": "image_ref", "blob": self.put(data), "media_type": media_type}
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store():
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore()
+        return _blob_store
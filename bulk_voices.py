@@ -0,0 +1,104 @@
+"""Builds the voice sample library without the UI.
+
+Every voice in TTSService.voices is paired with every tongue twister and with
+its own identity statement. The matrix runs on a bounded thread pool; speech
+requests go through the shared governor, which paces them, pauses every worker
+on a rate limit and retries throttled or failed requests (GOVERNOR_MAX_RETRIES).
+Finished items are appended to a JSONL manifest so an interrupted run resumes
+where it stopped, and clips that already exist on disk are skipped.
+
+    python bulk_voices.py --model tts-1-hd --format mp3 --concurrency 8
+"""
+import json
+import time
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from content.tongue_twisters import FlattenData, get_tongue_twisters
+from tts import SpeechSettings, TTSService, get_tts_service
+
+
+class BulkVoiceJob:
+    def __init__(self, model, format, voices=None, output_dir="content/audio_clips", manifest_path=None, concurrency=4):
+        self.model = model
+        self.format = format
+        self.voices = voices or list(TTSService.voices)
+        self.output_dir = Path(output_dir)
+        self.manifest_path = Path(manifest_path or Path("cache") / f"bulk_voices-{model}-{format}.jsonl")
+        self.concurrency = concurrency
+        self.manifest_lock = threading.Lock()
+
+    def items(self):
+        """Yields (item_id, voice, text, output_path) for the whole matrix."""
+        identity = get_tongue_twisters()
+        twists = FlattenData(identity).flatten_twists()
+        for voice in self.voices:
+            for text in [identity.identify(voice)] + twists:
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+                item_id = f"{voice}:{digest}"
+                output_path = self.output_dir / voice / f"{voice}-{self.model}-{digest}.{self.format}"
+                yield item_id, voice, text, output_path
+
+    def completed(self):
+        if not self.manifest_path.exists():
+            return set()
+        with self.manifest_path.open(encoding="utf-8") as manifest:
+            return {json.loads(line)["id"] for line in manifest if line.strip()}
+
+    def checkpoint(self, record):
+        with self.manifest_lock:
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.manifest_path.open("a", encoding="utf-8") as manifest:
+                manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def synthesize(self, item_id, voice, text, output_path):
+        settings = SpeechSettings(self.model, voice, self.format)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        started = time.monotonic()
+        # Retries and rate-limit pauses happen in the governor; an error here is final for this item.
+        # create_speech writes through a .part file and removes it on failure, so no partial clip is left behind
+        get_tts_service().create_speech(text, settings, path=str(output_path))
+
+        record = {"id": item_id, "voice": voice, "model": self.model, "format": self.format,
+                  "path": str(output_path), "seconds": round(time.monotonic() - started, 3)}
+        self.checkpoint(record)
+        return record
+
+    def run(self):
+        done = self.completed()
+        pending = [item for item in self.items() if item[0] not in done and not item[3].exists()]
+        print(f"{len(pending)} clips to generate ({len(done)} already in the manifest)")
+
+        failures = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self.synthesize, *item): item for item in pending}
+            for finished, future in enumerate(as_completed(futures), start=1):
+                item_id = futures[future][0]
+                try:
+                    record = future.result()
+                    print(f"[{finished}/{len(pending)}] {item_id} -> {record['path']}")
+                except Exception as e:
+                    failures += 1
+                    print(f"[{finished}/{len(pending)}] {item_id} failed: {e}")
+        return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="tts-1")
+    parser.add_argument("--format", default="mp3")
+    parser.add_argument("--voices", nargs="*", help="defaults to every TTSService voice")
+    parser.add_argument("--output-dir", default="content/audio_clips")
+    parser.add_argument("--manifest", help="defaults to cache/bulk_voices-<model>-<format>.jsonl")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    job = BulkVoiceJob(args.model, args.format, args.voices, args.output_dir, args.manifest, args.concurrency)
+    raise SystemExit(1 if job.run() else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,646 @@
+import os
+import queue
+import asyncio
+from client_pool import get_client_pool
+from image_cache import get_image_cache
+from blob_store import get_blob_store
+from response_cache import get_response_cache
+from telemetry import get_telemetry
+from model_catalog import models_by_provider
+from model_router import ModelRouter, AUTO_PROVIDER
+from governor import get_governor, estimate_tokens
+from context_window import ContextWindow, SUMMARY_MAX_TOKENS
+
+def split_data_url(url):
+    # "data:image/png;base64,AAAA" -> ("image/png", "AAAA")
+    header, data = url.split(",", 1)
+    return header[len("data:"):].split(";")[0], data
+
+class AnthropicClient:
+    def __init__(self, session=None):
+        self.provider = "Anthropic"
+        self.client = get_client_pool().get(self.provider)
+        # Requests are queued fairly per session by the shared governor
+        self.session = session
+
+    def list_models(self):
+        self.client.models.list(limit=20)
+
+    def encode_image(self, image_path):
+        _, media_type, data = get_image_cache().encode_file(image_path)
+        return self.image_block(media_type, data)
+
+    def image_block(self, media_type, data):
+        return {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": media_type,
+                "data": data
+            }
+        }
+
+    def prepare_messages(self, messages, image_path=None):
+        formatted_messages = []
+        system_parts = []
+    
+        for msg in messages:
+            if msg["role"] in ("developer", "system"):
+                # Anthropic takes a single system prompt; several are joined in order
+                system_parts.append(msg["content"])
+                continue
+            
+            if isinstance(msg["content"], list):
+                # If the message already contains a list (image + text)
+                formatted_messages.append({
+                    "role": msg["role"],
+                    "content": [self.convert_content_item(item) for item in msg["content"]]
+                })
+            elif image_path and msg == messages[-1] and msg["role"] == "user":
+                # For new messages with images
+                content = [
+                    self.encode_image(image_path),
+                    {"type": "text", "text": msg["content"]}
+                ]
+                formatted_messages.append({"role": msg["role"], "content": content})
+            else:
+                # For regular text messages
+                formatted_messages.append({
+                    "role": msg["role"],
+                    "content": msg["content"]
+                })
+    
+        system_message = "\n\n".join(system_parts) if system_parts else None
+        return formatted_messages, system_message
+
+    def encode_image_ref(self, item):
+        # Base64 is only produced here, while building the outgoing request
+        _, media_type, data = get_image_cache().encode_blob(item["blob"], item["media_type"], get_blob_store())
+        return self.image_block(media_type, data)
+
+    def convert_content_item(self, item):
+        if item["type"] == "image_ref":
+            return self.encode_image_ref(item)
+        # Images stored in OpenAI format (from older history) are re-shaped for Anthropic
+        if item["type"] == "image_url":
+            media_type, data = split_data_url(item["image_url"]["url"])
+            return {
+                "type": "image",
+                "source": {"type": "base64", "media_type": media_type, "data": data}
+            }
+        return item
+
+    def build_request(self, messages, model, params, image_path=None):
+        formatted_messages, system_message = self.prepare_messages(messages, image_path)
+    
+        request_params = {
+            "model": model,
+            "messages": formatted_messages,
+            # "stream": True  # Enable streaming
+        }
+    
+        additional_params = {
+            "max_tokens": params["max_tokens"],
+            "temperature": params["temperature"],
+            "top_p": params["top_p"],
+            "top_k": params["top_k"]
+        }
+    
+        if system_message:
+            request_params["system"] = [
+                {"type": "text", "text": system_message, "cache_control": {"type": "ephemeral"}}
+            ]
+        self.add_history_breakpoint(formatted_messages)
+    
+        for key, value in additional_params.items():
+            if value > 0.01:
+                request_params[key] = value
+
+        return request_params
+
+    def add_history_breakpoint(self, formatted_messages):
+        # Cache everything up to the last turn before the new message; the next
+        # request reads that prefix from Anthropic's prompt cache
+        if len(formatted_messages) < 2:
+            return
+        stable_turn = formatted_messages[-2]
+        content = stable_turn["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        # Copy the block so the breakpoint never leaks into session history
+        stable_turn["content"] = content[:-1] + [dict(content[-1], cache_control={"type": "ephemeral"})]
+
+    def read_usage(self, message):
+        return {
+            "input_tokens": message.usage.input_tokens,
+            "output_tokens": message.usage.output_tokens,
+            "cache_read_tokens": message.usage.cache_read_input_tokens or 0,
+            "cache_write_tokens": message.usage.cache_creation_input_tokens or 0,
+            "stop_reason": message.stop_reason
+        }
+
+    def send_message(self, messages, model, params, image_path=None, usage=None):
+        request_params = self.build_request(messages, model, params, image_path)
+        return self.stream_request(request_params, usage)
+
+    def stream_request(self, request_params, usage=None):
+        permit = get_governor().request(self.provider, request_params["model"], self.session, estimate_tokens(request_params))
+        # The slot is held until the stream ends, so concurrency counts streams in flight
+        with permit:
+            stream = permit.call(lambda: self.client.messages.stream(**request_params).__enter__())
+            try:
+                response_text = ""
+                for text in stream.text_stream:
+                    response_text += text
+                    yield text
+                if usage is not None:
+                    usage.update(self.read_usage(stream.get_final_message()))
+                return response_text
+            finally:
+                stream.close()
+
+    def complete(self, prompt, model, max_tokens):
+        with get_governor().request(self.provider, model, self.session, len(prompt) // 4 + max_tokens) as permit:
+            response = permit.call(
+                self.client.messages.create,
+                model=model,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}]
+            )
+        return "".join(block.text for block in response.content if block.type == "text")
+
+    async def send_message_async(self, async_client, messages, model, params, image_path=None, usage=None):
+        request_params = self.build_request(messages, model, params, image_path)
+        async for text in self.stream_request_async(async_client, request_params, usage):
+            yield text
+
+    async def stream_request_async(self, async_client, request_params, usage=None):
+        permit = get_governor().request(self.provider, request_params["model"], self.session, estimate_tokens(request_params))
+        async with permit:
+            stream = await permit.call_async(lambda: async_client.messages.stream(**request_params).__aenter__())
+            try:
+                async for text in stream.text_stream:
+                    yield text
+                if usage is not None:
+                    usage.update(self.read_usage(await stream.get_final_message()))
+            finally:
+                await stream.close()
+
+class OpenAIClient:
+    def __init__(self, session=None):
+        self.provider = "OpenAI"
+        self.client = get_client_pool().get(self.provider)
+        self.session = session
+
+    def encode_image(self, image_path):
+        _, media_type, data = get_image_cache().encode_file(image_path)
+        return self.image_block(media_type, data)
+
+    def image_block(self, media_type, data):
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{media_type};base64,{data}"
+            }
+        }
+
+    def prepare_messages(self, messages, image_path=None):
+        formatted_messages = []
+
+        for msg in messages:
+            if msg["role"] == "developer":
+                # Convert developer role to system role for OpenAI
+                formatted_messages.append({
+                    "role": "developer",
+                    "content": msg["content"]
+                })
+            elif isinstance(msg["content"], list):
+                # Handle messages that already contain images
+                formatted_messages.append({
+                    "role": msg["role"],
+                    "content": [self.convert_content_item(item) for item in msg["content"]]
+                })
+            elif image_path and msg == messages[-1] and msg["role"] == "user":
+                # Handle new messages with images
+                formatted_messages.append({
+                    "role": "user",
+                    "content": [
+                        self.encode_image(image_path),
+                        {"type": "text", "text": msg["content"]}
+                    ]
+                })
+            else:
+                # Handle regular text messages
+                formatted_messages.append({
+                    "role": msg["role"],
+                    "content": msg["content"]
+                })
+
+        return formatted_messages
+
+    def encode_image_ref(self, item):
+        # Base64 is only produced here, while building the outgoing request
+        _, media_type, data = get_image_cache().encode_blob(item["blob"], item["media_type"], get_blob_store())
+        return self.image_block(media_type, data)
+
+    def convert_content_item(self, item):
+        if item["type"] == "image_ref":
+            return self.encode_image_ref(item)
+        # Images stored in Anthropic format (from older history) are re-shaped for OpenAI
+        if item["type"] == "image":
+            source = item["source"]
+            return {
+                "type": "image_url",
+                "image_url": {"url": f"data:{source['media_type']};base64,{source['data']}"}
+            }
+        return item
+
+    def build_request(self, messages, model, params, image_path=None):
+        formatted_messages = self.prepare_messages(messages, image_path)
+
+        request_params = {
+            "model": model,
+            "messages": formatted_messages,
+            "max_tokens": params["max_tokens"],
+            "stream": True,  # Enable streaming
+            # The final chunk carries token usage, including automatically cached prompt tokens
+            "stream_options": {"include_usage": True}
+        }
+
+        if params["temperature_checkbox"]:
+            request_params["temperature"] = params["temperature"]
+        if params["top_p_checkbox"]:
+            request_params["top_p"] = params["top_p"]
+
+        return request_params
+
+    def read_usage(self, chunk, usage):
+        if chunk.choices and chunk.choices[0].finish_reason:
+            usage["stop_reason"] = chunk.choices[0].finish_reason
+        if chunk.usage:
+            details = chunk.usage.prompt_tokens_details
+            usage.update({
+                "input_tokens": chunk.usage.prompt_tokens,
+                "output_tokens": chunk.usage.completion_tokens,
+                "cache_read_tokens": (details.cached_tokens or 0) if details else 0,
+                "cache_write_tokens": 0  # OpenAI caches prefixes automatically and does not bill writes
+            })
+
+    def send_message(self, messages, model, params, image_path=None, usage=None):
+        request_params = self.build_request(messages, model, params, image_path)
+        return self.stream_request(request_params, usage)
+
+    def stream_request(self, request_params, usage=None):
+        permit = get_governor().request(self.provider, request_params["model"], self.session, estimate_tokens(request_params))
+        with permit:
+            stream = permit.call(self.client.chat.completions.create, **request_params)
+            try:
+                response_text = ""
+                for chunk in stream:
+                    if usage is not None:
+                        self.read_usage(chunk, usage)
+                    # The opening chunk carries only the role and an empty string; skipping it keeps
+                    # time-to-first-token (telemetry, hedging) measured on real text
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        response_text += chunk.choices[0].delta.content
+                        yield chunk.choices[0].delta.content
+                return response_text
+            finally:
+                stream.close()
+
+    def complete(self, prompt, model, max_tokens):
+        with get_governor().request(self.provider, model, self.session, len(prompt) // 4 + max_tokens) as permit:
+            response = permit.call(
+                self.client.chat.completions.create,
+                model=model,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}]
+            )
+        return response.choices[0].message.content or ""
+
+    async def send_message_async(self, async_client, messages, model, params, image_path=None, usage=None):
+        request_params = self.build_request(messages, model, params, image_path)
+        async for text in self.stream_request_async(async_client, request_params, usage):
+            yield text
+
+    async def stream_request_async(self, async_client, request_params, usage=None):
+        permit = get_governor().request(self.provider, request_params["model"], self.session, estimate_tokens(request_params))
+        async with permit:
+            stream = await permit.call_async(async_client.chat.completions.create, **request_params)
+            try:
+                async for chunk in stream:
+                    if usage is not None:
+                        self.read_usage(chunk, usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+
+class MultiProviderClient:
+    # Cheap models used to summarize turns that fall out of the context window
+    summary_models = {
+        "OpenAI": "gpt-4o-mini",
+        "Anthropic": "claude-3-5-haiku-20241022"
+    }
+
+    # {provider: {label: model_id}}, from the price/capability table in model_catalog
+    models = models_by_provider()
+
+    # Chat client class per provider; each is built on first use, which is also when its SDK is imported
+    client_classes = {"OpenAI": OpenAIClient, "Anthropic": AnthropicClient}
+
+    def __init__(self, session=None):
+        self.session = session
+        self.clients = {}
+        self.context_window = ContextWindow()
+        self.router = ModelRouter(get_telemetry())
+        self.hedge_default_delay = float(os.getenv("HEDGE_DELAY", 2.0))
+        self.hedge_min_delay = float(os.getenv("HEDGE_MIN_DELAY", 0.25))
+
+    def get_client(self, provider):
+        if provider not in self.clients:
+            if provider not in self.client_classes:
+                raise ValueError(f"Unknown provider: {provider}")
+            self.clients[provider] = self.client_classes[provider](self.session)
+        return self.clients[provider]
+
+    def available_models(self):
+        """self.models for the configured providers only; all of them when none are configured."""
+        configured = get_client_pool().configured_providers()
+        return {provider: models for provider, models in self.models.items() if provider in configured} or self.models
+
+    def summarize_turns(self, provider, previous_summary, turns):
+        lines = []
+        for msg in turns:
+            content = msg["content"]
+            if isinstance(content, list):
+                content = " ".join(item["text"] if item["type"] == "text" else "[image]" for item in content)
+            lines.append(f"{msg['role']}: {content}")
+        prompt = (
+            "Update the running summary of a conversation with the new turns below. "
+            "Keep facts, decisions and open questions; reply with the summary only.\n\n"
+            f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns:\n" + "\n".join(lines)
+        )
+        return self.get_client(provider).complete(prompt, self.summary_models[provider], SUMMARY_MAX_TOKENS)
+
+    def window_messages(self, messages, provider, model, params):
+        """Trims the history to the model's token budget before it is formatted."""
+        summarizer = None
+        if params.get("summarize_context"):
+            summarizer = lambda previous, turns: self.summarize_turns(provider, previous, turns)
+        max_tokens = params["max_tokens"] if params.get("max_tokens_checkbox", True) else 0
+        return self.context_window.fit(messages, model, max_tokens, summarizer)
+
+    def use_response_cache(self, params):
+        # Only deterministic requests are worth replaying
+        deterministic = not params["temperature_checkbox"] or params["temperature"] == 0
+        return params.get("response_cache", False) and deterministic
+
+    def send_message(self, messages, provider, model, params, image_path=None, usage=None):
+        if provider == AUTO_PROVIDER:
+            return self.send_auto(messages, params, image_path, usage)
+        if params.get("hedge") and params.get("hedge_backup") and tuple(params["hedge_backup"]) != (provider, model):
+            # Each raced request is recorded by telemetry on its own
+            return self.send_hedged(messages, provider, model, params, image_path, usage)
+        messages = self.window_messages(messages, provider, model, params)
+        client = self.get_client(provider)
+        usage = {} if usage is None else usage
+        if not self.use_response_cache(params):
+            stream = client.send_message(messages, model, params, image_path, usage)
+        else:
+            request_params = client.build_request(messages, model, params, image_path)
+            stream = self.send_cached(provider, client, request_params, usage)
+        # Records TTFT, chunk timing, usage and errors for the metrics panel and exporters
+        return get_telemetry().instrument(stream, provider, model, usage)
+
+    def send_auto(self, messages, params, image_path=None, usage=None):
+        """Streams from the router's pick, failing over while nothing has been yielded yet.
+
+        The model that answered is reported in usage["routed_to"].
+        """
+        usage = {} if usage is None else usage
+        # Windowing caps what is actually sent, so that is what has to fit the context
+        input_tokens = min(
+            sum(self.context_window.message_tokens(msg) for msg in messages), self.context_window.token_budget
+        )
+        output_tokens = params["max_tokens"] if params.get("max_tokens_checkbox", True) else SUMMARY_MAX_TOKENS
+        needs_images = image_path is not None or any(
+            isinstance(msg["content"], list) and any(item["type"] != "text" for item in msg["content"])
+            for msg in messages
+        )
+        plan = self.router.plan(
+            input_tokens, output_tokens, needs_images, params.get("ttft_target"),
+            get_client_pool().configured_providers()
+        )
+
+        failovers = []
+        for attempt, choice in enumerate(plan):
+            usage.clear()
+            started = False
+            try:
+                for chunk in self.send_message(messages, choice["provider"], choice["model"], params, image_path, usage):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                # Once text has been shown a retry would repeat it, so only clean failures fail over
+                if started or attempt == len(plan) - 1:
+                    raise
+                failovers.append(f"{choice['model']}: {type(e).__name__}")
+                continue
+            usage["routed_to"] = dict(choice, failovers=failovers)
+            return
+
+    def hedge_delay(self, model, params):
+        """Seconds to wait for the first chunk before hedging: the configured delay, else the model's recent p95."""
+        if params.get("hedge_delay"):
+            return params["hedge_delay"]
+        stats = self.router.model_stats().get(model)
+        if stats and stats["samples"] >= self.router.min_samples and stats["ttft_p95"]:
+            return max(stats["ttft_p95"], self.hedge_min_delay)
+        return self.hedge_default_delay
+
+    async def hedge_async(self, messages, primary, backup, params, delay, image_path=None, events=None):
+        """Races the primary against a backup started only if the primary is slow or fails.
+
+        The backup request goes out once `delay` passes without a first chunk (or
+        straight away if the primary fails first). Whichever yields first is kept
+        and the other is cancelled, which closes its HTTP connection. Events are
+        ("chunk", text), ("error", exception) and finally ("done", usage).
+        """
+        usages = {primary: {}, backup: {}}
+        streams = {}
+        tasks = {}
+
+        def start(target):
+            streams[target] = self.stream_async(messages, *target, params, image_path, usages[target])
+            tasks[target] = asyncio.ensure_future(streams[target].__anext__())
+
+        def failed(task):
+            # An empty reply ends with StopAsyncIteration, which still counts as an answer
+            return task.exception() is not None and not isinstance(task.exception(), StopAsyncIteration)
+
+        def first_answer(done):
+            return next((target for target, task in tasks.items() if task in done and not failed(task)), None)
+
+        try:
+            start(primary)
+            done, pending = await asyncio.wait({tasks[primary]}, timeout=delay)
+            if not done or failed(tasks[primary]):
+                start(backup)
+                pending.add(tasks[backup])
+            winner = first_answer(done)
+            while winner is None and pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = first_answer(done)
+            if winner is None:
+                raise tasks[primary].exception()
+
+            for target, task in tasks.items():
+                if target != winner:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    await streams[target].aclose()
+
+            first = tasks[winner]
+            if first.exception() is None:
+                events.put(("chunk", first.result()))
+                async for chunk in streams[winner]:
+                    events.put(("chunk", chunk))
+            events.put(("done", dict(usages[winner], hedge={
+                "provider": winner[0],
+                "model": winner[1],
+                "winner": "primary" if winner == primary else "backup",
+                "hedged": backup in tasks,
+                "delay": delay,
+            })))
+        except Exception as e:
+            events.put(("error", e))
+        finally:
+            for target, task in tasks.items():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await streams[target].aclose()
+
+    def send_hedged(self, messages, provider, model, params, image_path=None, usage=None):
+        """Streams from (provider, model), hedging with params["hedge_backup"] when the first chunk is late."""
+        usage = {} if usage is None else usage
+        events = queue.Queue()
+        future = get_client_pool().submit(self.hedge_async(
+            messages, (provider, model), tuple(params["hedge_backup"]), params,
+            self.hedge_delay(model, params), image_path, events
+        ))
+        try:
+            while True:
+                kind, payload = events.get()
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    usage.update(payload)
+                    return
+        finally:
+            # Closing the generator early (e.g. Streamlit "Stop") cancels both requests
+            if not future.done():
+                future.cancel()
+
+    def send_cached(self, provider, client, request_params, usage=None):
+        """Replays a cached response for an identical request, or streams and records it."""
+        cache = get_response_cache()
+        key = cache.make_key(provider, request_params)
+        usage = {} if usage is None else usage
+        cached = cache.get(key)
+        if cached:
+            chunks, cached_usage = cached
+            usage.update(cached_usage, response_cache_hit=True)
+            yield from chunks
+            return "".join(chunks)
+
+        chunks = []
+        for chunk in client.stream_request(request_params, usage):
+            chunks.append(chunk)
+            yield chunk
+        cache.put(key, provider, request_params["model"], chunks, usage)
+        return "".join(chunks)
+
+    async def send_cached_async(self, provider, client, request_params, usage):
+        cache = get_response_cache()
+        key = cache.make_key(provider, request_params)
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached:
+            chunks, cached_usage = cached
+            usage.update(cached_usage, response_cache_hit=True)
+            for chunk in chunks:
+                yield chunk
+            return
+
+        chunks = []
+        async for chunk in client.stream_request_async(get_client_pool().get_async(provider), request_params, usage):
+            chunks.append(chunk)
+            yield chunk
+        await asyncio.to_thread(cache.put, key, provider, request_params["model"], chunks, usage)
+
+    async def stream_async(self, messages, provider, model, params, image_path=None, usage=None):
+        """Async counterpart of send_message for one model; runs on the pool's loop."""
+        usage = {} if usage is None else usage
+        client = self.get_client(provider)
+        # Windowing may call a summarizer, so keep it off the event loop
+        windowed = await asyncio.to_thread(self.window_messages, messages, provider, model, params)
+        if self.use_response_cache(params):
+            request_params = client.build_request(windowed, model, params, image_path)
+            stream = self.send_cached_async(provider, client, request_params, usage)
+        else:
+            stream = client.send_message_async(
+                get_client_pool().get_async(provider), windowed, model, params, image_path, usage
+            )
+        stream = get_telemetry().instrument_async(stream, provider, model, usage)
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            # Close now rather than at garbage collection, so the request is recorded when it ends
+            await stream.aclose()
+
+    async def fan_out_async(self, messages, targets, params, image_path=None, events=None):
+        """Streams the conversation to every (provider, model) target concurrently.
+
+        Events are put on the queue as (index, kind, payload) tuples where kind is
+        "chunk", "error" or "done"; the "done" payload is the target's usage dict.
+        """
+        async def stream_target(index, provider, model):
+            usage = {}
+            try:
+                async for chunk in self.stream_async(messages, provider, model, params, image_path, usage):
+                    events.put((index, "chunk", chunk))
+            except Exception as e:
+                events.put((index, "error", e))
+            finally:
+                events.put((index, "done", usage))
+
+        await asyncio.gather(*(
+            stream_target(index, provider, model)
+            for index, (provider, model) in enumerate(targets)
+        ))
+
+    def send_message_fan_out(self, messages, targets, params, image_path=None):
+        """Yields (index, kind, payload) events from all targets, interleaved as they arrive.
+
+        Wall-clock time is that of the slowest target rather than the sum of all of them.
+        """
+        events = queue.Queue()
+        # Runs on the pool's shared loop so pooled async connections are reused between turns
+        future = get_client_pool().submit(
+            self.fan_out_async(messages, targets, params, image_path, events)
+        )
+
+        remaining = len(targets)
+        try:
+            while remaining:
+                event = events.get()
+                if event[1] == "done":
+                    remaining -= 1
+                yield event
+        finally:
+            # Cancel in-flight streams if the consumer stops early (e.g. Streamlit "Stop")
+            if remaining:
+                future.cancel()
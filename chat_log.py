@@ -0,0 +1,138 @@
+import os
+import gzip
+import json
+import queue
+import atexit
+import base64
+import shutil
+import logging
+import threading
+from pathlib import Path
+from blob_store import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+
+def loggable_content(content):
+    """Replaces image payloads with blob hashes so records stay small."""
+    if not isinstance(content, list):
+        return content
+    items = []
+    for item in content:
+        if item["type"] == "image_ref":
+            items.append({"type": "image", "blob": item["blob"], "media_type": item["media_type"]})
+        elif item["type"] == "image":
+            # Anthropic-format history item carrying base64
+            data = base64.b64decode(item["source"]["data"])
+            items.append({"type": "image", "blob": get_blob_store().put(data), "media_type": item["source"]["media_type"]})
+        elif item["type"] == "image_url":
+            # OpenAI-format history item carrying a data URL
+            header, data = item["image_url"]["url"].split(",", 1)
+            media_type = header[len("data:"):].split(";")[0]
+            items.append({"type": "image", "blob": get_blob_store().put(base64.b64decode(data)), "media_type": media_type})
+        else:
+            items.append(item)
+    return items
+
+
+class ChatLogWriter:
+    """Appends chat records to a JSONL file from a background thread.
+
+    log() only puts the record on a queue, so the request path never touches
+    the disk. The writer drains the queue in batches, rotates the file once it
+    passes max_bytes and optionally gzips rotated files.
+    """
+
+    def __init__(self, path, max_bytes=None, backup_count=None, compress=None, batch_size=256, flush_interval=1.0):
+        self.path = Path(path)
+        self.max_bytes = max_bytes or int(os.getenv("CHAT_LOG_MAX_BYTES", 10 * 1024 * 1024))
+        self.backup_count = backup_count if backup_count is not None else int(os.getenv("CHAT_LOG_BACKUPS", 5))
+        self.compress = compress if compress is not None else os.getenv("CHAT_LOG_COMPRESS") == "1"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="chat-log-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, record):
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            # Never block a chat turn on logging
+            self.dropped += 1
+
+    def next_batch(self):
+        try:
+            batch = [self.records.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.records.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while not (self.stop_event.is_set() and self.records.empty()):
+            batch = self.next_batch()
+            if batch:
+                try:
+                    self.write(batch)
+                except Exception as e:
+                    logger.warning("Failed to write %d chat log records: %s", len(batch), e)
+
+    def write(self, batch):
+        lines = []
+        for record in batch:
+            record = dict(record, content=loggable_content(record.get("content")))
+            lines.append(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.writelines(lines)
+            size = f.tell()
+        if size >= self.max_bytes:
+            self.rotate()
+
+    def backup_path(self, index):
+        suffix = f".{index}.gz" if self.compress else f".{index}"
+        return self.path.with_name(self.path.name + suffix)
+
+    def rotate(self):
+        if self.backup_count <= 0:
+            self.path.unlink()
+            return
+        oldest = self.backup_path(self.backup_count)
+        if oldest.exists():
+            oldest.unlink()
+        for index in range(self.backup_count - 1, 0, -1):
+            if self.backup_path(index).exists():
+                self.backup_path(index).rename(self.backup_path(index + 1))
+        if self.compress:
+            with self.path.open("rb") as source, gzip.open(self.backup_path(1), "wb") as target:
+                shutil.copyfileobj(source, target)
+            self.path.unlink()
+        else:
+            self.path.rename(self.backup_path(1))
+
+    def close(self):
+        """Flushes queued records; called automatically at interpreter exit."""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_chat_logger(path):
+    """Returns the process-wide writer for a log file, starting it on first use."""
+    path = Path(path).resolve()
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = ChatLogWriter(path)
+        return _writers[path]
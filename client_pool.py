@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import importlib
+import threading
+import weakref
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Provider SDKs by provider name. Each SDK is imported the first time one of its
+# clients is built, so a process only pays for the providers it actually calls.
+# The client classes must take api_key, base_url, max_retries and http_client,
+# as both official SDKs do. "base_url" names the override variable, e.g. to point
+# the app at mock_providers.py; unset means the SDK default.
+PROVIDER_PLUGINS = {
+    "OpenAI": {
+        "module": "openai", "client": "OpenAI", "async_client": "AsyncOpenAI",
+        "api_key": "OPENAI_API_KEY", "base_url": "OPENAI_BASE_URL",
+    },
+    "Anthropic": {
+        "module": "anthropic", "client": "Anthropic", "async_client": "AsyncAnthropic",
+        "api_key": "ANTHROPIC_API_KEY", "base_url": "ANTHROPIC_BASE_URL",
+    },
+}
+PROVIDERS = tuple(PROVIDER_PLUGINS)
+
+
+def env_number(name, default, cast=int):
+    value = os.getenv(name)
+    return cast(value) if value else default
+
+
+def load_sdk(provider):
+    """Imports a provider's SDK on first use and logs what the import cost."""
+    if provider not in PROVIDER_PLUGINS:
+        raise ValueError(f"Unknown provider: {provider}")
+    module = PROVIDER_PLUGINS[provider]["module"]
+    if module in sys.modules:
+        return sys.modules[module]
+    started = time.perf_counter()
+    sdk = importlib.import_module(module)
+    logger.info("Imported %s for %s in %.2fs", module, provider, time.perf_counter() - started)
+    return sdk
+
+
+class ClientPool:
+    """Process-wide registry of provider SDK clients.
+
+    Streamlit re-executes main.py on every rerun, so anything created there is
+    rebuilt per turn. This module is imported once per process, which lets every
+    session share the same clients and therefore the same keep-alive connections.
+    """
+
+    def __init__(self, max_connections=None, max_keepalive_connections=None, keepalive_expiry=None, timeout=None,
+                 base_urls=None):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or env_number("PROVIDER_POOL_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=max_keepalive_connections or env_number("PROVIDER_POOL_MAX_KEEPALIVE", 20),
+            keepalive_expiry=keepalive_expiry or env_number("PROVIDER_POOL_KEEPALIVE_EXPIRY", 120.0, float),
+        )
+        self.timeout = httpx.Timeout(timeout or env_number("PROVIDER_POOL_TIMEOUT", 600.0, float), connect=10.0)
+        self.base_urls = base_urls or {provider: os.getenv(plugin["base_url"]) for provider, plugin in PROVIDER_PLUGINS.items()}
+        self.lock = threading.Lock()
+        self.clients = {}
+        # Async clients hold connections tied to one event loop, so they are pooled per loop
+        self.async_clients = weakref.WeakKeyDictionary()
+        self.loop = None
+        self.warm_up_started = False
+
+    def create_client(self, provider):
+        sdk = load_sdk(provider)
+        plugin = PROVIDER_PLUGINS[provider]
+        return getattr(sdk, plugin["client"])(
+            api_key=os.getenv(plugin["api_key"]),
+            base_url=self.base_urls.get(provider),
+            # Retries go through the governor so they honor the shared backoff and queue
+            max_retries=0,
+            http_client=sdk.DefaultHttpxClient(limits=self.limits, timeout=self.timeout),
+        )
+
+    def create_async_client(self, provider):
+        sdk = load_sdk(provider)
+        plugin = PROVIDER_PLUGINS[provider]
+        return getattr(sdk, plugin["async_client"])(
+            api_key=os.getenv(plugin["api_key"]),
+            base_url=self.base_urls.get(provider),
+            max_retries=0,
+            http_client=sdk.DefaultAsyncHttpxClient(limits=self.limits, timeout=self.timeout),
+        )
+
+    def get(self, provider):
+        """Returns the shared synchronous client for a provider."""
+        with self.lock:
+            if provider not in self.clients:
+                self.clients[provider] = self.create_client(provider)
+            return self.clients[provider]
+
+    def get_async(self, provider):
+        """Returns the async client for a provider on the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            clients = self.async_clients.setdefault(loop, {})
+            if provider not in clients:
+                clients[provider] = self.create_async_client(provider)
+            return clients[provider]
+
+    def get_loop(self):
+        """Returns a long-lived event loop running in a daemon thread.
+
+        Running async work here (instead of a fresh loop per call) keeps the
+        async clients and their connections alive between turns.
+        """
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name="client-pool-loop", daemon=True).start()
+            return self.loop
+
+    def submit(self, coroutine):
+        """Schedules a coroutine on the shared loop and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.get_loop())
+
+    def configured_providers(self):
+        """Providers listed in ENABLED_PROVIDERS (comma-separated), else every provider with an API key set."""
+        enabled = os.getenv("ENABLED_PROVIDERS")
+        if enabled:
+            return [provider for provider in PROVIDERS if provider in {name.strip() for name in enabled.split(",")}]
+        return [provider for provider in PROVIDERS if os.getenv(PROVIDER_PLUGINS[provider]["api_key"])]
+
+    def warm_up(self, providers=None):
+        """Opens TCP/TLS connections ahead of the first real request.
+
+        A models listing is the cheapest authenticated call both providers offer;
+        failures are logged and ignored since warm-up is only an optimization.
+        """
+        providers = providers or self.configured_providers()
+        list_params = {"Anthropic": {"limit": 1}}
+
+        async def warm_up_async(provider):
+            await self.get_async(provider).models.list(**list_params.get(provider, {}))
+
+        for provider in providers:
+            try:
+                self.get(provider).models.list(**list_params.get(provider, {}))
+                self.submit(warm_up_async(provider)).result(timeout=30)
+                logger.info("Warmed up %s connections", provider)
+            except Exception as e:
+                logger.warning("Warm-up for %s failed: %s", provider, e)
+
+    def warm_up_in_background(self, providers=None):
+        """Starts warm-up once per process without blocking the caller."""
+        with self.lock:
+            if self.warm_up_started:
+                return
+            self.warm_up_started = True
+        threading.Thread(target=self.warm_up, args=(providers,), name="client-pool-warm-up", daemon=True).start()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ClientPool()
+        return _pool
@@ -1,4 +1,5 @@
 import random
+import threading
 
 class TongueTwisters:
     def __init__(self):
@@ -16,7 +17,7 @@ class TongueTwisters:
         self.twist = self.get_random_twist()
         
     def identify(self, voice):
-        self.voice = voice
+        # No state is kept, so one instance can serve every session
         return f"This is {voice} speaking. You're listening to the a.i. generated voice of {voice}. I am {voice}."
 
     def get_random_index(self, items):
@@ -76,8 +77,8 @@ class TongueTwisters:
         return triple_twists
     
 class FlattenData:
-    def __init__(self):
-        self.twists = TongueTwisters()
+    def __init__(self, twists=None):
+        self.twists = twists or TongueTwisters()
         self.classic_twists = self.twists.classic_twists
         self.quick_twists =   self.twists.quick_twists
         self.triple_twists =  self.twists.triple_twists
@@ -87,4 +88,16 @@ class FlattenData:
         twists.extend(self.classic_twists)
         twists.extend(self.quick_twists)
         twists.extend(self.triple_twists)
-        return twists
\ No newline at end of file
+        return twists
+
+
+_tongue_twisters = None
+_tongue_twisters_lock = threading.Lock()
+
+def get_tongue_twisters():
+    """The twists never change after construction, so the page builds them once per process."""
+    global _tongue_twisters
+    with _tongue_twisters_lock:
+        if _tongue_twisters is None:
+            _tongue_twisters = TongueTwisters()
+        return _tongue_twisters
@@ -0,0 +1,111 @@
+import os
+from model_catalog import MODEL_CATALOG
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Context window sizes in tokens; unknown models fall back to DEFAULT_CONTEXT_LIMIT
+CONTEXT_LIMITS = {model_id: info["context"] for model_id, info in MODEL_CATALOG.items()}
+DEFAULT_CONTEXT_LIMIT = 128000
+
+# Rough cost of one image; both providers bill roughly 1-2k tokens for a typical upload
+IMAGE_TOKENS = 1600
+# Upper bound on a rolling summary; reserved out of the budget when summarizing
+SUMMARY_MAX_TOKENS = 512
+SYSTEM_ROLES = ("developer", "system")
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Counts tokens with tiktoken when installed, otherwise estimates ~4 characters per token."""
+    global _encoding
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+class ContextWindow:
+    """Trims a conversation to a per-model token budget.
+
+    System/developer messages are always kept, then the newest turns that fit
+    the budget (the newest message is always sent). Token counts are cached on each message under
+    "tokens" so every message is counted once over the life of a session.
+    """
+
+    def __init__(self, token_budget=None):
+        self.token_budget = token_budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", 16000))
+
+    def message_tokens(self, message):
+        if "tokens" not in message:
+            content = message["content"]
+            if isinstance(content, list):
+                tokens = sum(
+                    count_tokens(item["text"]) if item["type"] == "text" else IMAGE_TOKENS
+                    for item in content
+                )
+            else:
+                tokens = count_tokens(content)
+            # Per-message framing overhead
+            message["tokens"] = tokens + 4
+        return message["tokens"]
+
+    def budget(self, model, max_tokens=0):
+        limit = CONTEXT_LIMITS.get(model, DEFAULT_CONTEXT_LIMIT)
+        return max(min(self.token_budget, limit - max_tokens), 0)
+
+    def split(self, messages, model, max_tokens=0):
+        """Returns (system_messages, dropped, kept) for the model's budget."""
+        system_messages = [msg for msg in messages if msg["role"] in SYSTEM_ROLES]
+        turns = [msg for msg in messages if msg["role"] not in SYSTEM_ROLES]
+
+        history_budget = self.budget(model, max_tokens) - sum(self.message_tokens(msg) for msg in system_messages)
+        offsets = [0]
+        for msg in turns:
+            offsets.append(offsets[-1] + self.message_tokens(msg))
+
+        start = 0
+        overflow = offsets[-1] - history_budget
+        if overflow > 0:
+            # Drop turns in steps of a quarter budget rather than one turn at a time,
+            # so the kept prefix stays byte-identical for several turns and the
+            # providers' prompt caches keep hitting
+            step = max(history_budget // 4, 1)
+            cut = -(-overflow // step) * step
+            while start < len(turns) - 1 and offsets[start] < cut:
+                start += 1
+
+        # Providers expect the conversation to open with a user turn
+        while start < len(turns) - 1 and turns[start]["role"] != "user":
+            start += 1
+
+        return system_messages, turns[:start], turns[start:]
+
+    def fit(self, messages, model, max_tokens=0, summarizer=None):
+        """Returns the messages to send.
+
+        With a summarizer, dropped turns are replaced by a rolling summary. The
+        summary is cached on the newest message it covers ("summary"), so each
+        turn only summarizes what has been dropped since the previous one.
+        """
+        reserve = SUMMARY_MAX_TOKENS if summarizer else 0
+        system_messages, dropped, kept = self.split(messages, model, max_tokens + reserve)
+        if not dropped:
+            return messages
+
+        if summarizer:
+            covered = max((i for i, msg in enumerate(dropped) if "summary" in msg), default=-1)
+            previous = dropped[covered]["summary"] if covered >= 0 else ""
+            if covered < len(dropped) - 1:
+                dropped[-1]["summary"] = summarizer(previous, dropped[covered + 1:])
+            summary_message = {
+                "role": "developer",
+                "content": f"Summary of the earlier conversation:\n{dropped[-1]['summary']}",
+            }
+            return system_messages + [summary_message] + kept
+
+        return system_messages + kept
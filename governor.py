@@ -0,0 +1,406 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from client_pool import PROVIDER_PLUGINS
+from context_window import IMAGE_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Rate limit headers: (limit, remaining) names for requests and tokens. Both providers
+# publish per-minute quotas, so buckets refill at limit / 60 per second.
+RATE_LIMIT_HEADERS = {
+    "OpenAI": {
+        "requests": ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests"),
+        "tokens": ("x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens"),
+    },
+    "Anthropic": {
+        "requests": ("anthropic-ratelimit-requests-limit", "anthropic-ratelimit-requests-remaining"),
+        # Newer accounts get separate input/output quotas; input is the one a request can exhaust up front
+        "tokens": ("anthropic-ratelimit-input-tokens-limit", "anthropic-ratelimit-input-tokens-remaining"),
+        "tokens_combined": ("anthropic-ratelimit-tokens-limit", "anthropic-ratelimit-tokens-remaining"),
+    },
+}
+# Quota or capacity pushback: pause the whole model and halve its concurrency
+THROTTLE_STATUSES = (429, 503, 529)
+# Transient failures worth retrying for this request only
+RETRY_STATUSES = (408, 409, 500, 502, 504)
+
+
+class GovernorTimeout(Exception):
+    """Raised when a request waited longer than the governor's max_wait for a slot."""
+
+
+def estimate_tokens(request_params):
+    """Rough tokens a request counts against the quota: prompt text, images and max_tokens."""
+    tokens = request_params.get("max_tokens", 0)
+    system = request_params.get("system") or []
+    for content in [msg["content"] for msg in request_params.get("messages", [])] + [system]:
+        if isinstance(content, str):
+            tokens += len(content) // 4
+        else:
+            for item in content:
+                tokens += len(item.get("text", "")) // 4 if item["type"] == "text" else IMAGE_TOKENS
+    return tokens
+
+
+def is_connection_error(error):
+    # Only an SDK that has been imported can have raised, so checking those keeps the imports lazy
+    for plugin in PROVIDER_PLUGINS.values():
+        sdk = sys.modules.get(plugin["module"])
+        if sdk is not None and isinstance(error, sdk.APIConnectionError):
+            return True
+    return False
+
+
+def response_headers(result):
+    """Headers of the HTTP response behind an SDK result or error, if it has one."""
+    # Streams, errors and binary content keep it on .response; streaming responses on .http_response
+    for name in ("response", "http_response"):
+        response = getattr(result, name, None)
+        if response is not None and hasattr(response, "headers"):
+            return response.headers
+    return None
+
+
+class TokenBucket:
+    """Unlimited until the provider's headers say otherwise."""
+
+    def __init__(self):
+        self.capacity = None
+        self.rate = None
+        self.level = 0.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def observe(self, limit, remaining, now):
+        self.refill(now)
+        if self.capacity is None:
+            self.level = remaining
+        self.capacity = limit
+        self.rate = limit / 60
+        # The provider's count is authoritative when it is lower (other processes share the quota)
+        self.level = min(self.level, remaining)
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken; requests larger than the bucket only wait for a full one."""
+        self.refill(now)
+        if self.capacity is None:
+            return 0.0
+        amount = min(amount, self.capacity)
+        return max(amount - self.level, 0) / self.rate if self.rate else 0.0
+
+    def take(self, amount):
+        if self.capacity is not None:
+            self.level -= min(amount, self.capacity)
+
+
+class Waiter:
+    def __init__(self, session, tokens, loop=None):
+        self.session = session
+        self.tokens = tokens
+        self.event = threading.Event()
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+
+
+class ModelGovernor:
+    """Admission control for one (provider, model).
+
+    Requests wait in per-session queues served round-robin, so one busy session
+    cannot starve the others. A request is admitted when the AIMD concurrency
+    limit, the request and token buckets (sized from rate limit headers) and any
+    throttle pause all allow it. Success grows the limit by ~1 per limit's worth
+    of requests; throttling halves it and pauses the model with jittered backoff.
+    """
+
+    def __init__(self, provider, model, initial_limit, max_limit, max_wait, max_backoff):
+        self.provider = provider
+        self.model = model
+        self.limit = float(initial_limit)
+        self.max_limit = max_limit
+        self.max_wait = max_wait
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.queues = OrderedDict()  # session -> deque of Waiters, in round-robin order
+        self.in_flight = 0
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.pause_until = 0.0
+        self.last_decrease = 0.0
+        self.timer = None
+        self.wake_at = 0.0
+        self.throttled = 0
+
+    def enqueue(self, waiter):
+        with self.lock:
+            self.queues.setdefault(waiter.session, deque()).append(waiter)
+            self.dispatch()
+
+    def withdraw(self, waiter):
+        """Removes a waiter that gave up; returns True if it was granted in the meantime."""
+        with self.lock:
+            if waiter.granted:
+                return True
+            waiters = self.queues.get(waiter.session)
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self.queues[waiter.session]
+            return False
+
+    def dispatch(self):
+        # Called with the lock held whenever capacity may have freed up
+        now = time.monotonic()
+        while self.queues and self.in_flight < int(self.limit):
+            session, waiters = next(iter(self.queues.items()))
+            waiter = waiters[0]
+            wait = max(self.pause_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(waiter.tokens, now))
+            if wait > 0:
+                self.schedule(wait)
+                return
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            waiters.popleft()
+            # The session moves to the back of the line
+            del self.queues[session]
+            if waiters:
+                self.queues[session] = waiters
+            self.in_flight += 1
+            waiter.grant()
+
+    def schedule(self, delay):
+        # One pending timer per model, moved earlier if a sooner wake-up is needed
+        wake_at = time.monotonic() + delay
+        if self.timer is not None:
+            if self.wake_at <= wake_at:
+                return
+            self.timer.cancel()
+        self.wake_at = wake_at
+        self.timer = threading.Timer(delay, self.wake)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def wake(self):
+        with self.lock:
+            self.timer = None
+            self.dispatch()
+
+    def acquire(self, session, tokens):
+        waiter = Waiter(session, tokens)
+        self.enqueue(waiter)
+        if not waiter.event.wait(self.max_wait) and not self.withdraw(waiter):
+            raise self.timeout_error()
+
+    async def acquire_async(self, session, tokens):
+        waiter = Waiter(session, tokens, asyncio.get_running_loop())
+        self.enqueue(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not self.withdraw(waiter):
+                raise self.timeout_error()
+        except asyncio.CancelledError:
+            if self.withdraw(waiter):
+                self.release()
+            raise
+
+    def timeout_error(self):
+        return GovernorTimeout(
+            f"{self.provider} {self.model} is at its rate limit; waited {self.max_wait:.0f}s for a slot. "
+            "Try again shortly."
+        )
+
+    def release(self, throttled=False):
+        with self.lock:
+            self.in_flight -= 1
+            if not throttled:
+                # Additive increase: about +1 once a full limit's worth of requests succeeds
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.dispatch()
+
+    def observe(self, headers):
+        names = RATE_LIMIT_HEADERS.get(self.provider, {})
+        now = time.monotonic()
+        with self.lock:
+            for kind, bucket in (("requests", self.requests), ("tokens", self.tokens), ("tokens_combined", self.tokens)):
+                if kind not in names:
+                    continue
+                limit_name, remaining_name = names[kind]
+                if limit_name not in headers or remaining_name not in headers:
+                    continue
+                try:
+                    bucket.observe(float(headers[limit_name]), float(headers[remaining_name]), now)
+                except ValueError:
+                    continue
+                if kind == "tokens":
+                    break
+
+    def backoff(self, error, attempt):
+        """Returns seconds to wait before retrying; throttling also pauses every queued request."""
+        status = getattr(error, "status_code", None)
+        headers = response_headers(error) or {}
+        try:
+            retry_after = float(headers.get("retry-after", ""))
+        except ValueError:
+            retry_after = None
+        # Full jitter keeps queued requests from retrying in lockstep
+        delay = retry_after if retry_after is not None else random.uniform(0, min(self.max_backoff, 2 ** attempt))
+        if status in THROTTLE_STATUSES:
+            now = time.monotonic()
+            with self.lock:
+                self.throttled += 1
+                self.pause_until = max(self.pause_until, now + delay)
+                # One multiplicative decrease per burst of simultaneous rejections
+                if now - self.last_decrease > 1.0:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+            logger.info("%s %s throttled (%s); pausing %.1fs, concurrency %.1f",
+                        self.provider, self.model, status, delay, self.limit)
+        return delay
+
+    def stats(self):
+        with self.lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queued": sum(len(waiters) for waiters in self.queues.values()),
+                "sessions_waiting": len(self.queues),
+                "throttled": self.throttled,
+                "requests_remaining": self.requests.level if self.requests.capacity is not None else None,
+                "tokens_remaining": self.tokens.level if self.tokens.capacity is not None else None,
+            }
+
+
+class Permit:
+    """One admitted request. Use as a (async) context manager and open the request with call()."""
+
+    def __init__(self, governor, session, tokens, max_retries):
+        self.governor = governor
+        self.session = session
+        self.tokens = tokens
+        self.max_retries = max_retries
+        self.held = False
+
+    def __enter__(self):
+        self.governor.acquire(self.session, self.tokens)
+        self.held = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.governor.acquire_async(self.session, self.tokens)
+        self.held = True
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    def release(self, throttled=False):
+        if self.held:
+            self.held = False
+            self.governor.release(throttled)
+
+    def retryable(self, error):
+        return is_connection_error(error) or getattr(error, "status_code", None) in THROTTLE_STATUSES + RETRY_STATUSES
+
+    def observe(self, result):
+        headers = response_headers(result)
+        if headers is not None:
+            self.governor.observe(headers)
+
+    def call(self, function, *args, **kwargs):
+        """Makes the request, retrying throttled and transient failures through the queue."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                self.observe(e)
+                if attempt == self.max_retries or not self.retryable(e):
+                    raise
+                delay = self.governor.backoff(e, attempt)
+                # Give the slot back and queue again, so retries are paced like everything else;
+                # throttling already paused the queue, other failures wait out their own delay
+                self.release(throttled=True)
+                time.sleep(0 if getattr(e, "status_code", None) in THROTTLE_STATUSES else delay)
+                self.governor.acquire(self.session, self.tokens)
+                self.held = True
+            else:
+                self.observe(result)
+                return result
+
+    async def call_async(self, function, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await function(*args, **kwargs)
+            except Exception as e:
+                self.observe(e)
+                if attempt == self.max_retries or not self.retryable(e):
+                    raise
+                delay = self.governor.backoff(e, attempt)
+                self.release(throttled=True)
+                await asyncio.sleep(0 if getattr(e, "status_code", None) in THROTTLE_STATUSES else delay)
+                await self.governor.acquire_async(self.session, self.tokens)
+                self.held = True
+            else:
+                self.observe(result)
+                return result
+
+
+class Governor:
+    """Process-wide registry of ModelGovernors, shared by every session and the TTS page."""
+
+    def __init__(self, initial_limit=None, max_limit=None, max_wait=None, max_retries=None, max_backoff=None):
+        self.initial_limit = initial_limit or int(os.getenv("GOVERNOR_INITIAL_CONCURRENCY", 8))
+        self.max_limit = max_limit or int(os.getenv("GOVERNOR_MAX_CONCURRENCY", 64))
+        self.max_wait = max_wait or float(os.getenv("GOVERNOR_MAX_WAIT", 60))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("GOVERNOR_MAX_RETRIES", 4))
+        self.max_backoff = max_backoff or float(os.getenv("GOVERNOR_MAX_BACKOFF", 30))
+        self.lock = threading.Lock()
+        self.models = {}
+
+    def get(self, provider, model):
+        with self.lock:
+            if (provider, model) not in self.models:
+                self.models[(provider, model)] = ModelGovernor(
+                    provider, model, self.initial_limit, self.max_limit, self.max_wait, self.max_backoff
+                )
+            return self.models[(provider, model)]
+
+    def request(self, provider, model, session=None, tokens=0):
+        """Returns a Permit; the request runs once the permit is entered."""
+        return Permit(self.get(provider, model), session or "default", tokens, self.max_retries)
+
+    def stats(self):
+        with self.lock:
+            models = dict(self.models)
+        return {f"{provider}:{model}": governor.stats() for (provider, model), governor in models.items()}
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = Governor()
+        return _governor
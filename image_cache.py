@@ -0,0 +1,97 @@
+import os
+import base64
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+
+
+class ImageCache:
+    """Process-wide LRU cache of base64-encoded images keyed by content hash.
+
+    Both provider payload builders read from the same entries, so an image is
+    read and encoded once no matter how many turns or providers it is sent to.
+    """
+
+    def __init__(self, max_bytes=None, max_paths=1024):
+        self.max_bytes = max_bytes or int(os.getenv("IMAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        self.max_paths = max_paths
+        self.entries = OrderedDict()  # digest -> (media_type, base64 data)
+        self.paths = OrderedDict()  # (path, mtime, size) -> digest, so unchanged files are not re-read
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, digest):
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None:
+                self.entries.move_to_end(digest)
+                self.hits += 1
+            return entry
+
+    def store(self, digest, media_type, data):
+        with self.lock:
+            if digest in self.entries:
+                return self.entries[digest]
+            self.misses += 1
+            entry = (media_type, data)
+            self.entries[digest] = entry
+            self.size += len(data)
+            # Always keep the newest entry, even if it alone exceeds the bound
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+            return entry
+
+    def encode_bytes(self, data, media_type, digest=None):
+        """Returns (digest, media_type, base64 data) for raw image bytes."""
+        digest = digest or hashlib.sha256(data).hexdigest()
+        entry = self.lookup(digest)
+        if entry is None:
+            entry = self.store(digest, media_type, base64.b64encode(data).decode("utf-8"))
+        return digest, entry[0], entry[1]
+
+    def encode_blob(self, digest, media_type, blob_store):
+        """Returns (digest, media_type, base64 data) for an image held in a BlobStore.
+
+        The blob is only mapped from disk on a cache miss.
+        """
+        entry = self.lookup(digest)
+        if entry is None:
+            with blob_store.open(digest) as blob:
+                entry = self.store(digest, media_type, base64.b64encode(blob).decode("utf-8"))
+        return digest, entry[0], entry[1]
+
+    def encode_file(self, image_path):
+        """Returns (digest, media_type, base64 data) for an image on disk."""
+        stat = os.stat(image_path)
+        path_key = (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            digest = self.paths.get(path_key)
+        if digest is not None:
+            entry = self.lookup(digest)
+            if entry is not None:
+                return digest, entry[0], entry[1]
+
+        media_type = mimetypes.guess_type(image_path)[0] or "image/jpeg"
+        with open(image_path, "rb") as image_file:
+            digest, media_type, data = self.encode_bytes(image_file.read(), media_type)
+        with self.lock:
+            self.paths[path_key] = digest
+            while len(self.paths) > self.max_paths:
+                self.paths.popitem(last=False)
+        return digest, media_type, data
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+        return _image_cache
@@ -0,0 +1,51 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_timed = set()
+_timed_lock = threading.Lock()
+
+
+class ImportTimer:
+    """Times the heavy imports of a script, one `module()` block each, and logs them once per process.
+
+        with ImportTimer("main.py") as imports:
+            with imports.module("streamlit"):
+                import streamlit as st
+
+    Streamlit reruns page scripts on every interaction, when every module is
+    already loaded, so only the first run of each script logs its timings.
+    Nothing is patched; for a breakdown of everything run `python -X importtime`.
+    """
+
+    def __init__(self, name, threshold=0.01):
+        self.name = name
+        self.threshold = threshold
+        self.timings = {}
+
+    def __enter__(self):
+        with _timed_lock:
+            self.first = self.name not in _timed
+            _timed.add(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    @contextmanager
+    def module(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    def __exit__(self, *exc_info):
+        if not self.first:
+            return
+        slow = sorted((item for item in self.timings.items() if item[1] >= self.threshold), key=lambda item: -item[1])
+        logger.info(
+            "%s imports took %.2fs: %s", self.name, time.perf_counter() - self.started,
+            ", ".join(f"{module} {seconds:.2f}s" for module, seconds in slow) or "nothing slow",
+        )
@@ -1,196 +1,92 @@
-import streamlit as st
-from pathlib import Path
-from openai import OpenAI
-from anthropic import Anthropic
 import os
-import tempfile
+import logging
+from import_timer import ImportTimer
+
+# LOG_LEVEL=INFO shows the cold-start import timings below, SDK loading and pool activity.
+# Only when run as the Streamlit script: importing this module must not reconfigure the host's logging.
+if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+
+import time
+import uuid
 import datetime
-from dotenv import load_dotenv
-import base64
 import mimetypes
+from pathlib import Path
 
-load_dotenv()
-
-class AnthropicClient:
-    def __init__(self):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-
-    def list_models(self):
-        self.client.models.list(limit=20)
-
-    def encode_image(self, image_path):
-        mime_type = mimetypes.guess_type(image_path)[0]
-        with open(image_path, "rb") as image_file:
-            return {
-                "type": "image",
-                "source": {
-                    "type": "base64",
-                    "media_type": mime_type,
-                    "data": base64.b64encode(image_file.read()).decode('utf-8')
-                }
-            }
+# Logged once per process; provider SDKs are not imported here but on first use (see client_pool)
+with ImportTimer("main.py") as imports:
+    with imports.module("streamlit"):
+        import streamlit as st
+    with imports.module("dotenv"):
+        from dotenv import load_dotenv
+    # Loads the shared infrastructure (client pool, telemetry, governor, caches) for the modules below
+    with imports.module("chat_clients"):
+        from chat_clients import MultiProviderClient
+    with imports.module("chat_log"):
+        from chat_log import get_chat_logger
+from client_pool import get_client_pool
+from blob_store import get_blob_store
+from telemetry import get_telemetry
+from model_catalog import describe
+from model_router import AUTO_PROVIDER
+from governor import get_governor, GovernorTimeout
 
-    def prepare_messages(self, messages, image_path=None):
-        formatted_messages = []
-        system_message = None
-    
-        for msg in messages:
-            if msg["role"] == "developer":
-                system_message = msg["content"]
-                continue
-            
-            if isinstance(msg["content"], list):
-                # If the message already contains a list (image + text)
-                formatted_messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            elif image_path and msg == messages[-1] and msg["role"] == "user":
-                # For new messages with images
-                content = [
-                    self.encode_image(image_path),
-                    {"type": "text", "text": msg["content"]}
-                ]
-                formatted_messages.append({"role": msg["role"], "content": content})
-            else:
-                # For regular text messages
-                formatted_messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-    
-        return formatted_messages, system_message
-
-    def send_message(self, messages, model, params, image_path=None):
-        formatted_messages, system_message = self.prepare_messages(messages, image_path)
-    
-        request_params = {
-            "model": model,
-            "messages": formatted_messages,
-            # "stream": True  # Enable streaming
-        }
-    
-        additional_params = {
-            "max_tokens": params["max_tokens"],
-            "temperature": params["temperature"],
-            "top_p": params["top_p"],
-            "top_k": params["top_k"]
-        }
-    
-        if system_message:
-            request_params["system"] = system_message
-    
-        for key, value in additional_params.items():
-            if value > 0.01:
-                request_params[key] = value
-    
-        with self.client.messages.stream(**request_params) as stream:
-            response_text = ""
-            for text in stream.text_stream:
-                response_text += text
-                yield text
-            return response_text
-
-class OpenAIClient:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-    def encode_image(self, image_path):
-        with open(image_path, 'rb') as image_file:
-            return {
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/jpeg;base64,{base64.b64encode(image_file.read()).decode('utf-8')}"
-                }
-            }
-
-    def prepare_messages(self, messages, image_path=None):
-        formatted_messages = []
-
-        for msg in messages:
-            if msg["role"] == "developer":
-                # Convert developer role to system role for OpenAI
-                formatted_messages.append({
-                    "role": "developer",
-                    "content": msg["content"]
-                })
-            elif isinstance(msg["content"], list):
-                # Handle messages that already contain images
-                formatted_messages.append(msg)
-            elif image_path and msg == messages[-1] and msg["role"] == "user":
-                # Handle new messages with images
-                formatted_messages.append({
-                    "role": "user",
-                    "content": [
-                        self.encode_image(image_path),
-                        {"type": "text", "text": msg["content"]}
-                    ]
-                })
-            else:
-                # Handle regular text messages
-                formatted_messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-
-        return formatted_messages
-
-    def send_message(self, messages, model, params, image_path=None):
-        formatted_messages = self.prepare_messages(messages, image_path)
-
-        request_params = {
-            "model": model,
-            "messages": formatted_messages,
-            "max_tokens": params["max_tokens"],
-            "stream": True  # Enable streaming
-        }
+load_dotenv()
 
-        if params["temperature_checkbox"]:
-            request_params["temperature"] = params["temperature"]
-        if params["top_p_checkbox"]:
-            request_params["top_p"] = params["top_p"]
+class StreamingRenderer:
+    """Coalesces streamed chunks into periodic placeholder updates.
+
+    Every markdown() call re-sends and re-parses the whole response, so drawing
+    once per token is quadratic in the response length. Chunks are buffered and
+    the placeholder is redrawn at most every `interval` seconds, or sooner once
+    `flush_chars` characters are waiting.
+    """
+
+    def __init__(self, placeholder, interval=None, flush_chars=None):
+        self.placeholder = placeholder
+        self.interval = interval if interval is not None else float(os.getenv("STREAM_RENDER_INTERVAL", 0.1))
+        self.flush_chars = flush_chars if flush_chars is not None else int(os.getenv("STREAM_RENDER_FLUSH_CHARS", 4000))
+        self.chunks = []
+        self.pending_chars = 0
+        self.last_render = 0.0
+        self.renders = 0
+        self.skipped = 0
+
+    @property
+    def text(self):
+        if len(self.chunks) > 1:
+            # Collapse to one piece so later joins only copy the new chunks once
+            self.chunks = ["".join(self.chunks)]
+        return self.chunks[0] if self.chunks else ""
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+        self.pending_chars += len(chunk)
+        now = time.monotonic()
+        if now - self.last_render >= self.interval or self.pending_chars >= self.flush_chars:
+            self.render(self.text + " ", now)
+        else:
+            self.skipped += 1
 
-        stream = self.client.chat.completions.create(**request_params)
-        response_text = ""
-        for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
-                response_text += chunk.choices[0].delta.content
-                yield chunk.choices[0].delta.content
-        return response_text
+    def render(self, body, now=None):
+        self.placeholder.markdown(body)
+        self.last_render = now or time.monotonic()
+        self.pending_chars = 0
+        self.renders += 1
 
-class MultiProviderClient:
-    def __init__(self):
-        self.anthropic_client = AnthropicClient()
-        self.openai_client = OpenAIClient()
-
-        self.models = {
-            "OpenAI": {
-                "03-mini": "03-mini",
-                "gpt-4o": "gpt-4o",
-                "gpt-4.5-preview":"gpt-4.5-preview",
-                "gpt-4o-search-preview":"gpt-4o-search-preview",
-                "computer-use-preview-2025-03-11":"computer-use-preview-2025-03-11",
-                "gpt-4o-mini": "gpt-4o-mini"
-            },
-            "Anthropic": {
-                "Claude-3 Sonnet": "claude-3-5-sonnet-20241022",
-                "Claude-3 Haiku": "claude-3-5-haiku-20241022",
-                "Claude-3 Opus": "claude-3-opus-20240229",
-                "Claude-3 Sonnet Previous": "claude-3-sonnet-20240229",
-                "Claude-3 Haiku Previous": "claude-3-haiku-20240229"
-            }
-        }
+    def finish(self):
+        """Draws the final text without the cursor and returns it."""
+        text = self.text
+        self.render(text)
+        return text
 
-    def send_message(self, messages, provider, model, params, image_path=None):
-        if provider == "OpenAI":
-            return self.openai_client.send_message(messages, model, params, image_path)
-        else:
-            return self.anthropic_client.send_message(messages, model, params, image_path)
+    def stats(self):
+        return {"renders": self.renders, "skipped": self.skipped}
 
 class StreamlitAIChat:
     def __init__(self):
-        self.client = MultiProviderClient()
         self.init_session_state()
+        self.client = MultiProviderClient(st.session_state.session_id)
 
 
     def init_session_state(self):
@@ -198,7 +94,9 @@ class StreamlitAIChat:
             'messages': [],
             'selected_provider': "OpenAI",
             'selected_model': "gpt-4o-mini",
+            'fan_out_targets': [],
             'logs_dir': Path.cwd() / "logs",
+            'session_id': uuid.uuid4().hex,
             'params': {
                 'max_tokens_checkbox': True,
                 'temperature_checkbox': False,
@@ -207,7 +105,13 @@ class StreamlitAIChat:
                 'max_tokens': 5000,
                 'temperature': 0.0,
                 'top_p': 0.0,
-                'top_k': 0
+                'top_k': 0,
+                'summarize_context': False,
+                'response_cache': False,
+                'ttft_target': None,
+                'hedge': False,
+                'hedge_backup': None,
+                'hedge_delay': 0.0
             }
         }
 
@@ -217,51 +121,24 @@ class StreamlitAIChat:
 
         st.session_state.logs_dir.mkdir(exist_ok=True)
 
-    def model_conditions(self, selected_model):
-        cost = {'input' : str, 'output' : str}
-        image_ingestion = bool
-        if selected_model == 'gpt-4o-mini':
-            cost['input'] = '$0.15 / 1m tokens'
-            cost['output'] = '$0.60 / 1m tokens'
-            image_ingestion = True
-        elif selected_model == 'gpt-4o':
-            cost['input'] = '$2.50 / 1m tokens'
-            cost['output'] = '$10.00 / 1m tokens'
-            image_ingestion = True
-        elif selected_model == '03-mini':
-            cost['input'] = '$1.10 / 1m tokens'
-            cost['output'] = '$4.40 / 1m tokens'
-            image_ingestion = False
-        elif selected_model == 'gpt-4.5-preview-2025-02-27':
-            cost['input'] = '$75.00 / 1m tokens'
-            cost['output'] = '$150.00 / 1m tokens'
-            image_ingestion = True
-        elif selected_model == 'computer-use-preview-2025-03-11':
-            cost['input'] = '  $3.00 / 1m tokens'
-            cost['output'] = '$12.00 / 1m tokens'
-            image_ingestion = True
-        else:
-            cost['input'] = '$ NA'
-            cost['output'] = '$ NA'
-            image_ingestion = True
-        costs = {'input_cost': cost['input'], 'output_cost': cost['output']}
-        supports_images = image_ingestion
-        return costs, supports_images
-
-    def save_uploaded_file(self, uploaded_file):
-        if uploaded_file:
-            file_extension = os.path.splitext(uploaded_file.name)[1]
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                temp_file_path = tmp_file.name
-            return temp_file_path  # Ensure this is returned correctly
-        return None
-
     def log_message(self, message):
-        timestamp = datetime.datetime.now().isoformat()
-        log_file = st.session_state.logs_dir / "chat_log.txt"
-        with log_file.open("a") as f:
-            f.write(f"\n{timestamp}\n{message['role']}: {message['content']}\n---\n")
+        # Queued for the background writer; no disk I/O on the request path
+        record = {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "session": st.session_state.session_id,
+            "provider": st.session_state.selected_provider,
+            "model": st.session_state.selected_model,
+            "role": message["role"],
+            "content": message["content"],
+        }
+        # Auto routing and hedging can answer with a model other than the selected one
+        answered = message.get("usage", {}).get("hedge") or message.get("usage", {}).get("routed_to")
+        if answered:
+            record["provider"] = answered["provider"]
+            record["model"] = answered["model"]
+        if message.get("fan_out"):
+            record["fan_out"] = message["fan_out"]
+        get_chat_logger(st.session_state.logs_dir / "chat_log.jsonl").log(record)
 
     def render_parameter_controls(self):
         max_token_container = st.container()
@@ -338,25 +215,95 @@ class StreamlitAIChat:
                     disabled= not st.session_state.params["top_k_checkbox"]
                 )
 
+        st.session_state.params["summarize_context"] = st.checkbox(
+            "Summarize turns that no longer fit the context budget",
+            value=st.session_state.params.get("summarize_context", False),
+            key="summarize_context_checkbox"
+        )
+        st.session_state.params["response_cache"] = st.checkbox(
+            "Replay cached answers for identical requests (temperature off or 0)",
+            value=st.session_state.params.get("response_cache", False),
+            key="response_cache_checkbox"
+        )
+        st.session_state.params["hedge"] = st.checkbox(
+            "Hedge slow first tokens with a backup model",
+            value=st.session_state.params.get("hedge", False),
+            key="hedge_checkbox"
+        )
+        if st.session_state.params["hedge"]:
+            backup_options = {
+                f"{provider} / {label}": (provider, model_id)
+                for provider, models in self.client.available_models().items()
+                for label, model_id in models.items()
+            }
+            backup_labels = list(backup_options.keys())
+            current = st.session_state.params.get("hedge_backup")
+            default = "Anthropic / Claude-3 Haiku"
+            backup = st.selectbox(
+                "Backup model",
+                options=backup_labels,
+                index=list(backup_options.values()).index(current) if current in backup_options.values()
+                else backup_labels.index(default) if default in backup_labels else 0,
+                key="hedge_backup_select"
+            )
+            st.session_state.params["hedge_backup"] = backup_options[backup]
+            st.session_state.params["hedge_delay"] = st.number_input(
+                "Hedge after (s)",
+                min_value=0.0,
+                max_value=60.0,
+                value=float(st.session_state.params.get("hedge_delay") or 0.0),
+                step=0.25,
+                key="hedge_delay_input",
+                help="0 uses the model's recent p95 time to first token."
+            )
+
     def render_sidebar(self):
         with st.sidebar:
             
             provider_expander = st.expander("Provider", expanded=False)
             with provider_expander:
 
+                available_models = self.client.available_models()
                 provider = st.selectbox(
                     "Select Provider",
-                    options=list(self.client.models.keys()),
+                    options=list(available_models.keys()) + [AUTO_PROVIDER],
                     key="provider_select"
                 )
 
-                model_name = st.selectbox(
-                    "Select Model",
-                    options=list(self.client.models[provider].keys()),
-                    index=1,
-                    key="model_select"
-                )
+                if provider == AUTO_PROVIDER:
+                    st.session_state.params["ttft_target"] = st.number_input(
+                        "p95 time to first token target (s)",
+                        min_value=0.1,
+                        max_value=60.0,
+                        value=st.session_state.params.get("ttft_target") or self.client.router.ttft_target,
+                        step=0.1,
+                        key="ttft_target_input",
+                        help="Each message goes to the cheapest model that can take it and has "
+                             "recently met this target; errors fail over to another provider."
+                    )
+                else:
+                    model_name = st.selectbox(
+                        "Select Model",
+                        options=list(self.client.models[provider].keys()),
+                        index=1,
+                        key="model_select"
+                    )
+                    st.caption(describe(self.client.models[provider][model_name]))
                 
+            compare_expander = st.expander("Compare Models", expanded=False)
+            with compare_expander:
+                target_labels = {
+                    f"{target_provider} / {label}": (target_provider, model_id)
+                    for target_provider, models in available_models.items()
+                    for label, model_id in models.items()
+                }
+                selected_targets = st.multiselect(
+                    "Send each message to",
+                    options=list(target_labels.keys()),
+                    key="fan_out_select",
+                    help="Pick two or more models to stream their answers side by side."
+                )
+
             image_upload_expander = st.expander("Image Upload", expanded=False)
             with image_upload_expander:
                 uploaded_file = st.file_uploader(
@@ -366,11 +313,14 @@ class StreamlitAIChat:
 
             st.session_state.uploaded_file = uploaded_file
             st.session_state.selected_provider = provider
-            st.session_state.selected_model = self.client.models[provider][model_name]
+            st.session_state.selected_model = (
+                AUTO_PROVIDER if provider == AUTO_PROVIDER else self.client.models[provider][model_name]
+            )
+            st.session_state.fan_out_targets = [target_labels[label] for label in selected_targets]
 
             if st.session_state.provider_select == "OpenAI":
                 dev_msg = st.text_area("Developer Message", height=100)
-            elif st.session_state.provider_select == "Anthropic":
+            else:
                 dev_msg = st.text_area("System Message", height=100)
                 
             col1, col2 = st.columns([1, 1])
@@ -385,7 +335,7 @@ class StreamlitAIChat:
                     if dev_msg:
                         if st.session_state.provider_select == "OpenAI":
                             message = {"role": "developer", "content": dev_msg}
-                        elif st.session_state.provider_select == "Anthropic":
+                        else:
                             message = {"role": "system", "content": dev_msg}
                         st.session_state.messages.append(message)
                         self.log_message(message)
@@ -394,50 +344,95 @@ class StreamlitAIChat:
             with st.expander("Additional Settings"):
                 st.write(self.render_parameter_controls())
 
+            with st.expander("Metrics"):
+                self.render_metrics_panel()
+
+    def render_metrics_panel(self):
+        telemetry = get_telemetry()
+        summary = telemetry.summary()
+        if not summary:
+            st.caption("No requests yet")
+            return
+        # Process-wide: every session's requests are included
+        st.dataframe(
+            [
+                {
+                    "model": key,
+                    "requests": stats["requests"],
+                    "errors": stats["errors"],
+                    "TTFT p50 (s)": stats["ttft_p50"],
+                    "TTFT p95 (s)": stats["ttft_p95"],
+                    "tok/s p50": stats["tokens_per_second_p50"],
+                    "input": stats["input_tokens"],
+                    "cached": stats["cache_read_tokens"],
+                    "output": stats["output_tokens"],
+                }
+                for key, stats in summary.items()
+            ],
+            hide_index=True
+        )
+        last = telemetry.recent(1)[0]
+        st.caption(
+            f"Last: {last['model']} · {last['status']} · "
+            f"TTFT {last['ttft'] or 0:.2f}s · total {last['duration']:.2f}s · {last['chunks']} chunks"
+        )
+        # This session's last answer: chunks that were buffered instead of redrawing the placeholder
+        render_stats = st.session_state.get("render_stats")
+        if render_stats:
+            renders = sum(stats["renders"] for stats in render_stats)
+            skipped = sum(stats["skipped"] for stats in render_stats)
+            st.caption(f"Rendering: {renders} redraws, {skipped} skipped ({skipped / max(renders + skipped, 1):.0%})")
+        limits = get_governor().stats()
+        if limits:
+            st.caption("Rate limit governor")
+            st.dataframe(
+                [
+                    {
+                        "model": key,
+                        "concurrency": round(stats["limit"], 1),
+                        "in flight": stats["in_flight"],
+                        "queued": stats["queued"],
+                        "throttled": stats["throttled"],
+                    }
+                    for key, stats in limits.items()
+                ],
+                hide_index=True
+            )
+        col1, col2 = st.columns([1, 1])
+        with col1:
+            st.download_button("JSON", telemetry.to_json(), file_name="metrics.json", mime="application/json")
+        with col2:
+            st.download_button("Prometheus", telemetry.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+
     def render_chat(self):
         st.title("Multi-Provider Chat Interface")
 
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
                 if isinstance(message["content"], list):
-                    # Render both text and images if the content is a list
-                    for content_item in message["content"]:
-                        if content_item["type"] == "text":
-                            st.write(content_item["text"])
-                        elif content_item["type"] == "image":
-                            # Handle Anthropic format
-                            image_data = content_item["source"]["data"]
-                            st.image(f"data:image/jpeg;base64,{image_data}", use_container_width="auto")
-                        elif content_item["type"] == "image_url":
-                            # Handle OpenAI format
-                            image_url = content_item["image_url"]["url"]
-                            st.image(image_url, use_container_width="auto")
+                    self.render_content_items(message["content"])
+                elif message.get("fan_out"):
+                    self.render_fan_out_history(message["fan_out"])
                 else:
                     st.write(message["content"])
+                    if message.get("usage"):
+                        self.render_usage(message["usage"])
         
         user_input = st.chat_input("Type your message...", key="ci")
 
         if user_input:
-            temp_image_path = None
-            if st.session_state['uploaded_file']:
-                temp_image_path = self.save_uploaded_file(st.session_state.uploaded_file)
-                # Create message with image based on provider
-                if st.session_state.selected_provider == "OpenAI":
-                    user_message = {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": user_input},
-                            self.client.openai_client.encode_image(temp_image_path)
-                        ]
-                    }
-                else:  # Anthropic
-                    user_message = {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": user_input},
-                            self.client.anthropic_client.encode_image(temp_image_path)
-                        ]
-                    }
+            uploaded_file = st.session_state['uploaded_file']
+            if uploaded_file:
+                # History keeps only a reference; the bytes go to the blob store and
+                # base64 is produced per request by each client's prepare_messages
+                media_type = uploaded_file.type or mimetypes.guess_type(uploaded_file.name)[0] or "image/jpeg"
+                user_message = {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": user_input},
+                        get_blob_store().reference(uploaded_file.getvalue(), media_type)
+                    ]
+                }
             else:
                 user_message = {"role": "user", "content": user_input}
 
@@ -447,21 +442,18 @@ class StreamlitAIChat:
             # Display the user message
             with st.chat_message("user", avatar=":material/person:"):
                 if isinstance(user_message["content"], list):
-                    for content_item in user_message["content"]:
-                        if content_item["type"] == "text":
-                            st.write(content_item["text"])
-                        elif content_item["type"] == "image":
-                            image_data = content_item["source"]["data"]
-                            st.image(f"data:image/jpeg;base64,{image_data}", use_container_width="auto")
-                        elif content_item["type"] == "image_url":
-                            st.image(content_item["image_url"]["url"], use_container_width="auto")
+                    self.render_content_items(user_message["content"])
                 else:
                     st.write(user_message["content"])
 
+            if len(st.session_state.fan_out_targets) > 1:
+                self.render_fan_out_response(st.session_state.fan_out_targets)
+                return
+
             # Get and display the streamed response
             with st.chat_message("assistant", avatar=":material/computer:"):
-                message_placeholder = st.empty()
-                full_response = ""
+                renderer = StreamingRenderer(st.empty())
+                usage = {}
 
                 try:
                     # Stream the response
@@ -470,30 +462,134 @@ class StreamlitAIChat:
                         st.session_state.selected_provider,
                         st.session_state.selected_model,
                         st.session_state.params,
-                        temp_image_path
+                        usage=usage
                     ):
-                        full_response += response_chunk
-                        # Update the message placeholder with the growing response
-                        message_placeholder.markdown(full_response + " ")
+                        # Buffered; the placeholder is only redrawn every few chunks
+                        renderer.write(response_chunk)
 
                     # Final update without the cursor
-                    message_placeholder.markdown(full_response)
-
-                    # Clean up the temporary image file if it exists
-                    if temp_image_path:
-                        os.unlink(temp_image_path)
+                    full_response = renderer.finish()
+                    st.session_state.render_stats = [renderer.stats()]
+                    if usage:
+                        self.render_usage(usage)
 
                     # Add the complete response to the message history
-                    assistant_message = {"role": "assistant", "content": full_response}
+                    assistant_message = {"role": "assistant", "content": full_response, "usage": usage}
                     st.session_state.messages.append(assistant_message)
                     self.log_message(assistant_message)
 
+                except GovernorTimeout as e:
+                    # Shared quota exhausted for longer than the queue allows; not a failure of the request itself
+                    st.warning(str(e))
                 except Exception as e:
                     st.error(f"An error occurred: {str(e)}")
-                    if temp_image_path and os.path.exists(temp_image_path):
-                        os.unlink(temp_image_path)
+
+    def render_content_items(self, content_items):
+        # Render both text and images if the content is a list
+        for content_item in content_items:
+            if content_item["type"] == "text":
+                st.write(content_item["text"])
+            elif content_item["type"] == "image_ref":
+                # Streamlit reads the blob from disk; nothing is held in session state
+                st.image(str(get_blob_store().path(content_item["blob"])), use_container_width="auto")
+            elif content_item["type"] == "image":
+                # Handle Anthropic format
+                image_data = content_item["source"]["data"]
+                st.image(f"data:image/jpeg;base64,{image_data}", use_container_width="auto")
+            elif content_item["type"] == "image_url":
+                # Handle OpenAI format
+                image_url = content_item["image_url"]["url"]
+                st.image(image_url, use_container_width="auto")
+
+    def render_usage(self, usage):
+        if usage.get("routed_to"):
+            route = usage["routed_to"]
+            failovers = f" after {', '.join(route['failovers'])}" if route["failovers"] else ""
+            st.caption(f"Routed to {route['provider']} / {route['model']} ({route['reason']}){failovers}")
+        if usage.get("hedge", {}).get("hedged"):
+            hedge = usage["hedge"]
+            st.caption(
+                f"Hedged after {hedge['delay']:.2f}s without a first token; "
+                f"answered by the {hedge['winner']} ({hedge['provider']} / {hedge['model']})"
+            )
+        if usage.get("response_cache_hit"):
+            st.caption("Replayed from the local response cache")
+        # Cache reads/writes show whether the provider's prompt cache is being hit
+        st.caption(
+            f"Input tokens: {usage.get('input_tokens', 0)} · "
+            f"cache read: {usage.get('cache_read_tokens', 0)} · "
+            f"cache write: {usage.get('cache_write_tokens', 0)} · "
+            f"output tokens: {usage.get('output_tokens', 0)}"
+        )
+
+    def render_fan_out_history(self, responses):
+        columns = st.columns(len(responses))
+        for column, response in zip(columns, responses):
+            with column:
+                st.caption(f"{response['provider']} / {response['model']}")
+                if response.get("error"):
+                    st.error(response["error"])
+                else:
+                    st.markdown(response["content"])
+                    if response.get("usage"):
+                        self.render_usage(response["usage"])
+
+    def render_fan_out_response(self, targets):
+        with st.chat_message("assistant", avatar=":material/computer:"):
+            columns = st.columns(len(targets))
+            renderers = []
+            for column, (provider, model) in zip(columns, targets):
+                with column:
+                    st.caption(f"{provider} / {model}")
+                    renderers.append(StreamingRenderer(st.empty()))
+
+            responses = [
+                {"provider": provider, "model": model, "content": "", "error": None}
+                for provider, model in targets
+            ]
+
+            for index, kind, payload in self.client.send_message_fan_out(
+                st.session_state.messages,
+                targets,
+                st.session_state.params
+            ):
+                response = responses[index]
+                if kind == "chunk":
+                    renderers[index].write(payload)
+                elif kind == "error":
+                    response["error"] = f"An error occurred: {str(payload)}"
+                    renderers[index].placeholder.error(response["error"])
+                elif kind == "done":
+                    response["content"] = renderers[index].text
+                    response["usage"] = payload
+                    if not response["error"]:
+                        renderers[index].finish()
+                        if payload:
+                            with columns[index]:
+                                self.render_usage(payload)
+
+            st.session_state.render_stats = [renderer.stats() for renderer in renderers]
+
+            # The first successful answer carries the conversation forward
+            primary = next((r for r in responses if not r["error"] and r["content"]), None)
+            if primary is None:
+                # Like a failed single request: the errors are shown above and no empty turn enters the history
+                return
+            assistant_message = {
+                "role": "assistant",
+                "content": primary["content"],
+                "fan_out": responses
+            }
+            st.session_state.messages.append(assistant_message)
+            self.log_message(assistant_message)
 
 def main():
+    if os.getenv("PROVIDER_POOL_WARM_UP") == "1":
+        # Only the first run in the process starts it; later reruns are no-ops
+        get_client_pool().warm_up_in_background()
+    if os.getenv("METRICS_PORT"):
+        # Prometheus scrape endpoint; started once per process like the pool warm-up
+        get_telemetry().start_exporter(int(os.getenv("METRICS_PORT")))
     chat_app = StreamlitAIChat()
     chat_app.render_sidebar()
     chat_app.render_chat()
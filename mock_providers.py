@@ -0,0 +1,291 @@
+"""Local stand-ins for the OpenAI and Anthropic streaming APIs.
+
+One HTTP server answers both protocols: OpenAI chat completions under /v1/chat/completions
+and Anthropic messages under /v1/messages, streamed as SSE when the request asks for it,
+plus silent audio from OpenAI's /v1/audio/speech.
+The latency before the first token and the token rate are configurable, and the reply is
+capped at the request's max_tokens. Point the app at it through the base URL overrides:
+
+    python mock_providers.py --port 8765 --ttft 0.3 --tokens-per-second 80
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 ANTHROPIC_BASE_URL=http://127.0.0.1:8765 \\
+        OPENAI_API_KEY=mock ANTHROPIC_API_KEY=mock streamlit run main.py
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+from itertools import cycle, islice
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit")
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client connection pooling is exercised too
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.mock
+
+    def read_json(self):
+        length = int(self.headers.get("content-length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_rate_limit_headers(self):
+        for name, value in getattr(self, "rate_limit_headers", {}).items():
+            self.send_header(name, value)
+
+    def send_json(self, body, status=200, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.send_rate_limit_headers()
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_stream(self):
+        self.send_response(200)
+        self.send_rate_limit_headers()
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+
+    def send_event(self, data, event=None):
+        payload = (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+        chunk = payload.encode("utf-8")
+        self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/").endswith("/models"):
+            self.send_json({"object": "list", "data": [{"id": "mock", "object": "model", "type": "model"}],
+                            "has_more": False, "first_id": "mock", "last_id": "mock"})
+        else:
+            self.send_json({"error": {"type": "not_found", "message": self.path}}, 404)
+
+    def do_POST(self):
+        request = self.read_json()
+        self.config.requests += 1
+        allowed, remaining, retry_after = self.config.admit()
+        if self.config.requests_per_minute:
+            limit = str(self.config.requests_per_minute)
+            self.rate_limit_headers = {
+                "x-ratelimit-limit-requests": limit, "x-ratelimit-remaining-requests": str(remaining),
+                "anthropic-ratelimit-requests-limit": limit, "anthropic-ratelimit-requests-remaining": str(remaining),
+            }
+        if not allowed:
+            self.config.rejected += 1
+            self.send_json({"type": "error", "error": {"type": "rate_limit_error", "message": "Rate limit exceeded"}},
+                           429, {"retry-after": f"{retry_after:.2f}"})
+        elif self.path.endswith("/chat/completions"):
+            self.chat_completions(request)
+        elif self.path.endswith("/messages"):
+            self.messages(request)
+        elif self.path.endswith("/audio/speech"):
+            self.speech(request)
+        else:
+            self.send_json({"error": {"type": "not_found", "message": self.path}}, 404)
+
+    def truncated(self, request):
+        """True when the request's max_tokens, not the configured reply length, ends the reply."""
+        limit = request.get("max_tokens") or request.get("max_completion_tokens")
+        return bool(limit) and limit < self.config.output_tokens
+
+    def tokens(self, request):
+        """Yields the reply's text deltas, paced to the configured token rate."""
+        limit = request.get("max_tokens") or request.get("max_completion_tokens") or self.config.output_tokens
+        for index, word in enumerate(islice(cycle(WORDS), min(limit, self.config.output_tokens))):
+            if index and self.config.tokens_per_second:
+                time.sleep(1 / self.config.tokens_per_second)
+            yield word if index == 0 else " " + word
+
+    def chat_completions(self, request):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        input_tokens = self.config.input_tokens(request)
+
+        def chunk(delta, finish_reason=None, usage=None):
+            choices = [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            return json.dumps({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                               "model": request["model"], "choices": choices, "usage": usage})
+
+        # Nothing is sent until the first-token latency has passed
+        time.sleep(self.config.ttft)
+        if not request.get("stream"):
+            text = "".join(self.tokens(request))
+            self.send_json({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": request["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": input_tokens, "completion_tokens": len(text.split()),
+                          "total_tokens": input_tokens + len(text.split())},
+            })
+            return
+
+        self.start_stream()
+        self.send_event(chunk({"role": "assistant", "content": ""}))
+        output_tokens = 0
+        for text in self.tokens(request):
+            output_tokens += 1
+            self.send_event(chunk({"content": text}))
+        self.send_event(chunk({}, "length" if self.truncated(request) else "stop"))
+        if request.get("stream_options", {}).get("include_usage"):
+            self.send_event(chunk(None, usage={
+                "prompt_tokens": input_tokens, "completion_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens, "prompt_tokens_details": {"cached_tokens": 0},
+            }))
+        self.send_event("[DONE]")
+        self.end_stream()
+
+    def messages(self, request):
+        message_id = f"msg_{uuid.uuid4().hex[:12]}"
+        input_tokens = self.config.input_tokens(request)
+        usage = {"input_tokens": input_tokens, "output_tokens": 0,
+                 "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+        message = {"id": message_id, "type": "message", "role": "assistant", "model": request["model"],
+                   "content": [], "stop_reason": None, "stop_sequence": None, "usage": usage}
+
+        # Nothing is sent until the first-token latency has passed
+        time.sleep(self.config.ttft)
+        if not request.get("stream"):
+            text = "".join(self.tokens(request))
+            self.send_json(dict(message, content=[{"type": "text", "text": text}], stop_reason="end_turn",
+                                usage=dict(usage, output_tokens=len(text.split()))))
+            return
+
+        self.start_stream()
+        self.send_event(json.dumps({"type": "message_start", "message": message}), "message_start")
+        self.send_event(json.dumps({"type": "content_block_start", "index": 0,
+                                    "content_block": {"type": "text", "text": ""}}), "content_block_start")
+        output_tokens = 0
+        for text in self.tokens(request):
+            output_tokens += 1
+            self.send_event(json.dumps({"type": "content_block_delta", "index": 0,
+                                        "delta": {"type": "text_delta", "text": text}}), "content_block_delta")
+        self.send_event(json.dumps({"type": "content_block_stop", "index": 0}), "content_block_stop")
+        self.send_event(json.dumps({"type": "message_delta", "usage": {"output_tokens": output_tokens},
+                                    "delta": {"stop_reason": "max_tokens" if self.truncated(request) else "end_turn",
+                                              "stop_sequence": None}}), "message_delta")
+        self.send_event(json.dumps({"type": "message_stop"}), "message_stop")
+        self.end_stream()
+
+    def speech(self, request):
+        """Silent 16-bit audio, about a tenth of a second per input word, sent in paced chunks."""
+        time.sleep(self.config.ttft)
+        self.send_response(200)
+        self.send_rate_limit_headers()
+        self.send_header("content-type", "application/octet-stream")
+        self.send_header("transfer-encoding", "chunked")
+        self.end_headers()
+        for _ in range(len(request.get("input", "").split())):
+            chunk = bytes(4800)
+            self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+            self.wfile.flush()
+            if self.config.tokens_per_second:
+                time.sleep(1 / self.config.tokens_per_second)
+        self.end_stream()
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up mid-stream whenever a consumer stops early; that is not a server fault
+        pass
+
+
+class MockProviderServer:
+    """Runs MockProviderHandler on a background thread.
+
+    ttft is the delay before the first token, tokens_per_second paces the rest
+    (0 streams as fast as possible) and output_tokens caps every reply. With
+    requests_per_minute set, responses carry both providers' rate limit headers
+    and requests over the quota get a 429 with Retry-After.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, ttft=0.0, tokens_per_second=0.0, output_tokens=256,
+                 requests_per_minute=0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.requests_per_minute = requests_per_minute
+        self.requests = 0
+        self.rejected = 0
+        # The quota refills continuously, as the providers' own limits do
+        self.allowance = float(requests_per_minute)
+        self.refilled = time.monotonic()
+        self.lock = threading.Lock()
+        self.httpd = MockHTTPServer((host, port), MockProviderHandler)
+        self.httpd.mock = self
+        self.thread = None
+
+    def admit(self):
+        """Returns (allowed, remaining, retry_after) for one request against the quota."""
+        if not self.requests_per_minute:
+            return True, 0, 0.0
+        rate = self.requests_per_minute / 60
+        now = time.monotonic()
+        with self.lock:
+            self.allowance = min(self.requests_per_minute, self.allowance + (now - self.refilled) * rate)
+            self.refilled = now
+            if self.allowance < 1:
+                return False, 0, (1 - self.allowance) / rate
+            self.allowance -= 1
+            return True, int(self.allowance), 0.0
+
+    @staticmethod
+    def input_tokens(request):
+        # Same ~4 characters per token estimate as context_window without tiktoken
+        return len(json.dumps(request.get("messages", []))) // 4 + 1
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_urls(self):
+        """Base URLs in the form ClientPool(base_urls=...) expects."""
+        return {"OpenAI": f"{self.url}/v1", "Anthropic": self.url}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-providers", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="0 streams unthrottled")
+    parser.add_argument("--output-tokens", type=int, default=256)
+    parser.add_argument("--requests-per-minute", type=int, default=0, help="quota enforced with 429s; 0 is unlimited")
+    args = parser.parse_args()
+
+    server = MockProviderServer(args.host, args.port, args.ttft, args.tokens_per_second, args.output_tokens,
+                                args.requests_per_minute)
+    print(f"Mock providers on {server.url} (OpenAI: {server.base_urls['OpenAI']}, Anthropic: {server.base_urls['Anthropic']})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Chat models by id. Prices are USD per million tokens; "context" is the context
+# window in tokens; "routable" models may be picked by the Auto router (preview
+# models with special request shapes are only available when chosen by hand).
+# "03-mini" and "claude-3-haiku-20240229" are not valid provider ids (o3-mini also
+# rejects max_tokens and temperature), so the router must never send them traffic.
+MODEL_CATALOG = {
+    "03-mini": {
+        "provider": "OpenAI", "label": "03-mini",
+        "input_cost": 1.10, "output_cost": 4.40, "images": False, "context": 200000, "routable": False,
+    },
+    "gpt-4o": {
+        "provider": "OpenAI", "label": "gpt-4o",
+        "input_cost": 2.50, "output_cost": 10.00, "images": True, "context": 128000, "routable": True,
+    },
+    "gpt-4.5-preview": {
+        "provider": "OpenAI", "label": "gpt-4.5-preview",
+        "input_cost": 75.00, "output_cost": 150.00, "images": True, "context": 128000, "routable": False,
+    },
+    "gpt-4o-search-preview": {
+        "provider": "OpenAI", "label": "gpt-4o-search-preview",
+        "input_cost": 2.50, "output_cost": 10.00, "images": False, "context": 128000, "routable": False,
+    },
+    "computer-use-preview-2025-03-11": {
+        "provider": "OpenAI", "label": "computer-use-preview-2025-03-11",
+        "input_cost": 3.00, "output_cost": 12.00, "images": True, "context": 8192, "routable": False,
+    },
+    "gpt-4o-mini": {
+        "provider": "OpenAI", "label": "gpt-4o-mini",
+        "input_cost": 0.15, "output_cost": 0.60, "images": True, "context": 128000, "routable": True,
+    },
+    "claude-3-5-sonnet-20241022": {
+        "provider": "Anthropic", "label": "Claude-3 Sonnet",
+        "input_cost": 3.00, "output_cost": 15.00, "images": True, "context": 200000, "routable": True,
+    },
+    "claude-3-5-haiku-20241022": {
+        "provider": "Anthropic", "label": "Claude-3 Haiku",
+        "input_cost": 0.80, "output_cost": 4.00, "images": False, "context": 200000, "routable": True,
+    },
+    "claude-3-opus-20240229": {
+        "provider": "Anthropic", "label": "Claude-3 Opus",
+        "input_cost": 15.00, "output_cost": 75.00, "images": True, "context": 200000, "routable": True,
+    },
+    "claude-3-sonnet-20240229": {
+        "provider": "Anthropic", "label": "Claude-3 Sonnet Previous",
+        "input_cost": 3.00, "output_cost": 15.00, "images": True, "context": 200000, "routable": True,
+    },
+    "claude-3-haiku-20240229": {
+        "provider": "Anthropic", "label": "Claude-3 Haiku Previous",
+        "input_cost": 0.25, "output_cost": 1.25, "images": True, "context": 200000, "routable": False,
+    },
+}
+
+
+def models_by_provider():
+    """{provider: {label: model_id}} in catalog order, as the sidebar selectors expect."""
+    models = {}
+    for model_id, info in MODEL_CATALOG.items():
+        models.setdefault(info["provider"], {})[info["label"]] = model_id
+    return models
+
+
+def request_cost(model_id, input_tokens, output_tokens):
+    """Estimated USD cost of one request, or None for a model missing from the catalog."""
+    info = MODEL_CATALOG.get(model_id)
+    if info is None:
+        return None
+    return (input_tokens * info["input_cost"] + output_tokens * info["output_cost"]) / 1_000_000
+
+
+def describe(model_id):
+    info = MODEL_CATALOG.get(model_id)
+    if info is None:
+        return "Price and capabilities unknown"
+    return (
+        f"${info['input_cost']:.2f} in · ${info['output_cost']:.2f} out per 1M tokens · "
+        f"{info['context'] // 1000}k context · images {'supported' if info['images'] else 'not supported'}"
+    )
@@ -0,0 +1,93 @@
+import os
+import time
+from model_catalog import MODEL_CATALOG, request_cost
+from telemetry import percentile
+
+AUTO_PROVIDER = "Auto"
+
+
+class ModelRouter:
+    """Picks a model for "Auto" requests from the catalog and live telemetry.
+
+    Candidates are the routable models that can take the request (images,
+    context size), cheapest first. The first one whose p95 time-to-first-token
+    over the last `window` seconds meets the target wins; models with fewer than
+    `min_samples` recent requests are assumed to meet it so they get measured.
+    Models whose recent error rate exceeds `max_error_rate` are skipped. The rest
+    of the plan is the failover order, starting with the other provider.
+    """
+
+    def __init__(self, telemetry, ttft_target=None, window=None, min_samples=None, max_error_rate=None, max_attempts=3):
+        self.telemetry = telemetry
+        self.ttft_target = ttft_target or float(os.getenv("ROUTER_TTFT_TARGET", 2.0))
+        self.window = window or float(os.getenv("ROUTER_WINDOW", 300))
+        self.min_samples = min_samples or int(os.getenv("ROUTER_MIN_SAMPLES", 5))
+        self.max_error_rate = max_error_rate or float(os.getenv("ROUTER_MAX_ERROR_RATE", 0.25))
+        self.max_attempts = max_attempts
+
+    def model_stats(self):
+        """{model_id: {"samples", "ttft_p95", "error_rate"}} over the rolling window."""
+        since = time.time() - self.window
+        grouped = {}
+        for record in self.telemetry.recent():
+            # Cancelled requests and local response-cache replays say nothing about the provider's latency
+            if record["timestamp"] >= since and record["status"] != "cancelled" and not record.get("response_cache_hit"):
+                grouped.setdefault(record["model"], []).append(record)
+        stats = {}
+        for model_id, records in grouped.items():
+            ttfts = [record["ttft"] for record in records if record["status"] == "ok" and record["ttft"] is not None]
+            stats[model_id] = {
+                "samples": len(records),
+                "ttft_p95": percentile(ttfts, 95),
+                "error_rate": sum(record["status"] == "error" for record in records) / len(records),
+            }
+        return stats
+
+    def candidates(self, input_tokens, output_tokens, needs_images=False, providers=None):
+        models = [
+            model_id for model_id, info in MODEL_CATALOG.items()
+            if info["routable"]
+            and (not providers or info["provider"] in providers)
+            and (info["images"] or not needs_images)
+            and info["context"] >= input_tokens + output_tokens
+        ]
+        return sorted(models, key=lambda model_id: request_cost(model_id, input_tokens, output_tokens))
+
+    def plan(self, input_tokens, output_tokens, needs_images=False, ttft_target=None, providers=None):
+        """Returns the models to try in order as {"provider", "model", "reason"} dicts."""
+        ttft_target = ttft_target or self.ttft_target
+        candidates = self.candidates(input_tokens, output_tokens, needs_images, providers)
+        if not candidates:
+            raise ValueError("No routable model supports this request")
+        stats = self.model_stats()
+
+        def sampled(model_id):
+            return stats.get(model_id, {}).get("samples", 0) >= self.min_samples
+
+        def healthy(model_id):
+            return not sampled(model_id) or stats[model_id]["error_rate"] <= self.max_error_rate
+
+        def fast_enough(model_id):
+            if not sampled(model_id) or stats[model_id]["ttft_p95"] is None:
+                return True
+            return stats[model_id]["ttft_p95"] <= ttft_target
+
+        healthy_models = [model_id for model_id in candidates if healthy(model_id)]
+        fast_models = [model_id for model_id in healthy_models if fast_enough(model_id)]
+        if fast_models:
+            primary, reason = fast_models[0], f"cheapest with p95 TTFT within {ttft_target:g}s"
+        elif healthy_models:
+            primary = min(healthy_models, key=lambda model_id: stats[model_id]["ttft_p95"] or 0)
+            reason = f"no model meets {ttft_target:g}s; lowest p95 TTFT"
+        else:
+            primary, reason = candidates[0], "every candidate is failing; cheapest"
+
+        # Fail over to the other provider first, since provider outages take out all of its models
+        primary_provider = MODEL_CATALOG[primary]["provider"]
+        rest = [model_id for model_id in healthy_models + candidates if model_id != primary]
+        rest = sorted(dict.fromkeys(rest), key=lambda model_id: MODEL_CATALOG[model_id]["provider"] == primary_provider)
+
+        plan = [{"provider": primary_provider, "model": primary, "reason": reason}]
+        for model_id in rest[:self.max_attempts - 1]:
+            plan.append({"provider": MODEL_CATALOG[model_id]["provider"], "model": model_id, "reason": "failover"})
+        return plan
@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+
+class ResponseCache:
+    """SQLite cache of complete streamed responses keyed by the exact request.
+
+    Entries expire after `ttl` seconds and the least recently read entries are
+    evicted once there are more than `max_entries`. Chunks are stored as they
+    arrived so a hit can be replayed through the same generator interface.
+    """
+
+    def __init__(self, path=None, ttl=None, max_entries=None):
+        self.path = Path(path or os.getenv("RESPONSE_CACHE_PATH", Path.cwd() / "cache" / "responses.sqlite"))
+        self.ttl = ttl or float(os.getenv("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT,
+                model TEXT,
+                chunks TEXT,
+                usage TEXT,
+                created REAL,
+                accessed REAL
+            )"""
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def make_key(provider, request_params):
+        """Hashes a canonical JSON form of the request exactly as it would be sent."""
+        canonical = json.dumps(
+            {"provider": provider, "request": request_params},
+            sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns (chunks, usage) for a fresh entry, or None."""
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT chunks, usage, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[2] > self.ttl:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self.connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), json.loads(row[1])
+
+    def put(self, key, provider, model, chunks, usage):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, json.dumps(chunks), json.dumps(usage or {}), now, now)
+            )
+            self.evict(now)
+
+    def evict(self, now):
+        self.connection.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets in seconds, shared by time-to-first-token and total duration
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+TOKEN_KINDS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile; None for an empty list."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class RequestTimer:
+    """Timing state for one streamed request, updated on every chunk."""
+
+    def __init__(self, provider, model):
+        self.provider = provider
+        self.model = model
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.first_chunk = None
+        self.last_chunk = None
+        self.chunks = 0
+        self.max_gap = 0.0
+
+    def chunk(self):
+        now = time.perf_counter()
+        if self.first_chunk is None:
+            self.first_chunk = now
+        else:
+            self.max_gap = max(self.max_gap, now - self.last_chunk)
+        self.last_chunk = now
+        self.chunks += 1
+
+    def record(self, status, usage, error=None):
+        total = time.perf_counter() - self.started
+        ttft = self.first_chunk - self.started if self.first_chunk is not None else None
+        output_tokens = usage.get("output_tokens")
+        generating = total - ttft if ttft is not None else 0
+        record = {
+            "timestamp": self.timestamp,
+            "provider": self.provider,
+            "model": self.model,
+            "status": status,
+            "error": error,
+            "ttft": ttft,
+            "duration": total,
+            "chunks": self.chunks,
+            "max_gap": self.max_gap,
+            "tokens_per_second": output_tokens / generating if output_tokens and generating > 0 else None,
+            "stop_reason": usage.get("stop_reason"),
+            "response_cache_hit": bool(usage.get("response_cache_hit")),
+        }
+        record.update({kind: usage.get(kind, 0) for kind in TOKEN_KINDS})
+        return record
+
+
+class Telemetry:
+    """Per-request streaming metrics.
+
+    The newest `capacity` request records are kept in a ring buffer for the
+    sidebar and JSON export; counters and histograms for the Prometheus export
+    accumulate over the life of the process.
+    """
+
+    def __init__(self, capacity=None):
+        self.records = deque(maxlen=capacity or int(os.getenv("METRICS_BUFFER_SIZE", 1000)))
+        self.lock = threading.Lock()
+        self.requests = {}  # (provider, model, status) -> count
+        self.tokens = {}  # (provider, model, kind) -> count
+        self.histograms = {}  # (name, provider, model) -> [bucket counts..., +Inf count, sum]
+        self.exporter = None
+
+    def instrument(self, stream, provider, model, usage):
+        """Wraps a chunk generator, recording one request once it ends, fails or is closed early.
+
+        `usage` must be the dict the wrapped generator fills in.
+        """
+        timer = RequestTimer(provider, model)
+        status, error = "ok", None
+        try:
+            for chunk in stream:
+                timer.chunk()
+                yield chunk
+        except GeneratorExit:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.add(timer.record(status, usage, error))
+
+    async def instrument_async(self, stream, provider, model, usage):
+        """Async counterpart of instrument()."""
+        timer = RequestTimer(provider, model)
+        status, error = "ok", None
+        try:
+            async for chunk in stream:
+                timer.chunk()
+                yield chunk
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+            raise
+        except BaseException:
+            # Closed early or cancelled (e.g. a fan-out the user stopped)
+            status = "cancelled"
+            raise
+        finally:
+            self.add(timer.record(status, usage, error))
+
+    def add(self, record):
+        labels = (record["provider"], record["model"])
+        # A response-cache replay costs no tokens and its timing is local, so it only counts as a request
+        status = "cache_hit" if record["response_cache_hit"] and record["status"] == "ok" else record["status"]
+        with self.lock:
+            self.records.append(record)
+            self.requests[labels + (status,)] = self.requests.get(labels + (status,), 0) + 1
+            if record["response_cache_hit"]:
+                return
+            for kind in TOKEN_KINDS:
+                self.tokens[labels + (kind,)] = self.tokens.get(labels + (kind,), 0) + (record[kind] or 0)
+            self.observe("chat_time_to_first_token_seconds", labels, record["ttft"])
+            self.observe("chat_request_duration_seconds", labels, record["duration"])
+
+    def observe(self, name, labels, value):
+        if value is None:
+            return
+        counts = self.histograms.setdefault((name,) + labels, [0] * (len(LATENCY_BUCKETS) + 1) + [0.0])
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                counts[index] += 1
+        counts[len(LATENCY_BUCKETS)] += 1
+        counts[-1] += value
+
+    def recent(self, limit=None):
+        with self.lock:
+            records = list(self.records)
+        return records[-limit:] if limit else records
+
+    def summary(self):
+        """Per "provider:model" stats over the records in the ring buffer."""
+        grouped = {}
+        for record in self.recent():
+            grouped.setdefault(f"{record['provider']}:{record['model']}", []).append(record)
+        result = {}
+        for key, records in grouped.items():
+            provider_records = [record for record in records if not record["response_cache_hit"]]
+            ok = [record for record in provider_records if record["status"] == "ok"]
+            ttfts = [record["ttft"] for record in ok if record["ttft"] is not None]
+            rates = [record["tokens_per_second"] for record in ok if record["tokens_per_second"]]
+            result[key] = {
+                "requests": len(records),
+                "errors": sum(record["status"] == "error" for record in records),
+                "ttft_p50": percentile(ttfts, 50),
+                "ttft_p95": percentile(ttfts, 95),
+                "tokens_per_second_p50": percentile(rates, 50),
+                "duration_p95": percentile([record["duration"] for record in ok], 95),
+                **{kind: sum(record[kind] or 0 for record in provider_records) for kind in TOKEN_KINDS},
+            }
+        return result
+
+    def to_json(self):
+        return json.dumps({"summary": self.summary(), "requests": self.recent()}, indent=2)
+
+    def to_prometheus(self):
+        """Renders the process-lifetime counters and histograms in the Prometheus text format."""
+        def labels(provider, model, **extra):
+            pairs = {"provider": provider, "model": model, **extra}
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs.items()) + "}"
+
+        with self.lock:
+            requests = dict(self.requests)
+            tokens = dict(self.tokens)
+            histograms = {key: list(counts) for key, counts in self.histograms.items()}
+
+        lines = ["# HELP chat_requests_total Streamed chat requests by outcome (cache_hit: replayed from the local response cache).", "# TYPE chat_requests_total counter"]
+        for (provider, model, status), count in sorted(requests.items()):
+            lines.append(f"chat_requests_total{labels(provider, model, status=status)} {count}")
+        lines += ["# HELP chat_tokens_total Tokens reported by the providers.", "# TYPE chat_tokens_total counter"]
+        for (provider, model, kind), count in sorted(tokens.items()):
+            lines.append(f"chat_tokens_total{labels(provider, model, kind=kind.removesuffix('_tokens'))} {count}")
+        for name, help_text in (("chat_time_to_first_token_seconds", "Time from request to first streamed chunk."),
+                                ("chat_request_duration_seconds", "Time from request to the end of the stream.")):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (metric, provider, model), counts in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(LATENCY_BUCKETS, counts):
+                    lines.append(f"{name}_bucket{labels(provider, model, le=bound)} {count}")
+                lines.append(f"{name}_bucket{labels(provider, model, le='+Inf')} {counts[len(LATENCY_BUCKETS)]}")
+                lines.append(f"{name}_sum{labels(provider, model)} {counts[-1]}")
+                lines.append(f"{name}_count{labels(provider, model)} {counts[len(LATENCY_BUCKETS)]}")
+        return "\n".join(lines) + "\n"
+
+    def start_exporter(self, port, host="0.0.0.0"):
+        """Serves /metrics (Prometheus text) and /metrics.json from a daemon thread, once per process."""
+        with self.lock:
+            if self.exporter is not None:
+                return self.exporter or None
+            telemetry = self
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def log_message(self, format, *args):
+                    pass
+
+                def do_GET(self):
+                    path = self.path.split("?")[0]
+                    if path == "/metrics":
+                        body, content_type = telemetry.to_prometheus(), "text/plain; version=0.0.4"
+                    elif path == "/metrics.json":
+                        body, content_type = telemetry.to_json(), "application/json"
+                    else:
+                        self.send_error(404)
+                        return
+                    data = body.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("content-type", content_type)
+                    self.send_header("content-length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+
+            try:
+                self.exporter = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:
+                # Another process (or an earlier Streamlit server) already holds the port
+                logger.warning("Metrics exporter not started on port %s: %s", port, e)
+                self.exporter = False
+                return None
+            self.exporter.daemon_threads = True
+            threading.Thread(target=self.exporter.serve_forever, name="metrics-exporter", daemon=True).start()
+            logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+            return self.exporter
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = Telemetry()
+        return _telemetry
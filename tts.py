@@ -0,0 +1,734 @@
+from pathlib import Path
+from datetime import datetime
+import os
+import io
+import re
+import json
+import wave
+import shutil
+import hashlib
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import numpy as np
+from client_pool import get_client_pool
+from governor import get_governor
+
+load_dotenv()
+
+class AudioCombiner:
+    def __init__(self, directory):
+        self.directory = directory
+        self.audio_files = []
+
+    def gather_audio_files(self):
+        """Gathers all audio files from the specified directory, sorted by creation time."""
+        audio_extensions = ('.mp3', '.wav', '.ogg', '.flac', '.aac')
+        # Create a list of tuples (file_path, creation_time)
+        self.audio_files = [(file, os.path.getctime(os.path.join(self.directory, file))) 
+                            for file in os.listdir(self.directory) 
+                            if file.endswith(audio_extensions)]
+
+        # Sort by creation time
+        self.audio_files.sort(key=lambda x: x[1])  # Sort by the second element in the tuple (creation_time)
+
+    def combine_audio_files(self, output_filename):
+        """Combines the audio files into a single audio file.
+
+        Inputs that share the output's codec are joined at the frame/container
+        level without decoding. Anything else goes through a single streaming
+        ffmpeg decode -> encode pass. Either way the output is written as it is
+        produced, so time is linear and memory constant in the number of clips.
+        """
+        if not self.audio_files:
+            print("No audio files found to combine.")
+            return
+
+        output_path = os.path.join(self.directory, output_filename)
+        output_format = output_filename.split('.')[-1].lower()
+        input_paths = [os.path.join(self.directory, audio_file) for audio_file, _ in self.audio_files]
+
+        same_codec = all(path.lower().endswith(f".{output_format}") for path in input_paths)
+        if same_codec and output_format in self.frame_concatenators:
+            print(f"Joining {len(input_paths)} {output_format} files without re-encoding...")
+            self.frame_concatenators[output_format](self, input_paths, output_path)
+        else:
+            print(f"Transcoding {len(input_paths)} files into {output_format} in one pass...")
+            self.transcode_concat(input_paths, output_path, output_format)
+        print(f"Combined audio file saved as: {output_path}")
+
+    # Frame-level concatenation
+
+    @staticmethod
+    def id3v2_size(header):
+        """Length of a leading ID3v2 tag (0 if there is none)."""
+        if len(header) < 10 or header[:3] != b"ID3":
+            return 0
+        size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        footer = 10 if header[5] & 0x10 else 0
+        return 10 + size + footer
+
+    @staticmethod
+    def mp3_frame_length(header):
+        """Byte length of the MPEG audio frame starting with this 4-byte header, or 0."""
+        if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+            return 0
+        version = (header[1] >> 3) & 0x03  # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+        layer = (header[1] >> 1) & 0x03  # 1 = Layer III
+        bitrate_index = (header[2] >> 4) & 0x0F
+        rate_index = (header[2] >> 2) & 0x03
+        padding = (header[2] >> 1) & 0x01
+        if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            return 0
+        if version == 3:
+            bitrates = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+            sample_rate = (44100, 48000, 32000)[rate_index]
+            return 144 * bitrates[bitrate_index] * 1000 // sample_rate + padding
+        bitrates = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+        sample_rate = (22050, 24000, 16000)[rate_index] // (2 if version == 0 else 1)
+        return 72 * bitrates[bitrate_index] * 1000 // sample_rate + padding
+
+    @staticmethod
+    def mp3_frame_duration(header):
+        """Seconds of audio in the Layer III frame starting with this (valid) header."""
+        version = (header[1] >> 3) & 0x03
+        sample_rate = (44100, 48000, 32000)[(header[2] >> 2) & 0x03]
+        if version != 3:
+            sample_rate //= 2 if version == 2 else 4
+        return (1152 if version == 3 else 576) / sample_rate
+
+    def copy_range(self, source, output, length, block_size=1024 * 1024):
+        while length > 0:
+            block = source.read(min(block_size, length))
+            if not block:
+                break
+            output.write(block)
+            length -= len(block)
+
+    def concat_mpeg_frames(self, input_paths, output_path):
+        """Joins MP3/ADTS files by copying their frames, dropping per-file tags and
+        the Xing/Info header frame whose frame count only describes one file."""
+        with open(output_path, "wb") as output:
+            for path in input_paths:
+                size = os.path.getsize(path)
+                with open(path, "rb") as source:
+                    start = self.id3v2_size(source.read(10))
+                    end = size
+                    source.seek(max(size - 128, 0))
+                    if source.read(3) == b"TAG":
+                        end = size - 128  # ID3v1 trailer
+
+                    source.seek(start)
+                    frame_length = self.mp3_frame_length(source.read(4))
+                    if frame_length:
+                        source.seek(start)
+                        first_frame = source.read(frame_length)
+                        if b"Xing" in first_frame or b"Info" in first_frame:
+                            start += frame_length
+                    source.seek(start)
+                    self.copy_range(source, output, end - start)
+
+    def concat_wav(self, input_paths, output_path, block_frames=65536):
+        """Joins PCM WAV files that share sample rate, width and channel count."""
+        with wave.open(input_paths[0], "rb") as first:
+            params = first.getparams()
+        with wave.open(output_path, "wb") as output:
+            output.setnchannels(params.nchannels)
+            output.setsampwidth(params.sampwidth)
+            output.setframerate(params.framerate)
+            for path in input_paths:
+                with wave.open(path, "rb") as source:
+                    if source.getparams()[:3] != params[:3]:
+                        raise ValueError(f"{path} does not match the sample format of {input_paths[0]}")
+                    while frames := source.readframes(block_frames):
+                        output.writeframes(frames)
+
+    def concat_bytes(self, input_paths, output_path):
+        """Headerless PCM joins by plain concatenation."""
+        with open(output_path, "wb") as output:
+            for path in input_paths:
+                with open(path, "rb") as source:
+                    shutil.copyfileobj(source, output)
+
+    frame_concatenators = {
+        "mp3": concat_mpeg_frames,
+        "aac": concat_mpeg_frames,
+        "wav": concat_wav,
+        "pcm": concat_bytes,
+    }
+
+    # Streaming transcode fallback
+
+    sample_rate = 24000  # OpenAI TTS output rate
+    channels = 1
+
+    def pcm_args(self):
+        return ["-f", "s16le", "-ar", str(self.sample_rate), "-ac", str(self.channels)]
+
+    @staticmethod
+    def ffmpeg(purpose):
+        """Path of the ffmpeg binary; a clear error naming what needed it if it is not installed."""
+        path = shutil.which("ffmpeg")
+        if path is None:
+            raise RuntimeError(f"ffmpeg is required to {purpose} but was not found on the PATH. "
+                               "Install it (https://ffmpeg.org) and try again.")
+        return path
+
+    def transcode_concat(self, input_paths, output_path, output_format, block_size=1024 * 1024):
+        """Decodes each input to PCM in turn and pipes it into one running encoder."""
+        ffmpeg = self.ffmpeg(f"combine clips into {output_format}")
+        encoder = subprocess.Popen(
+            [ffmpeg, "-loglevel", "error", "-y", *self.pcm_args(), "-i", "pipe:0", output_path],
+            stdin=subprocess.PIPE
+        )
+        try:
+            for path in input_paths:
+                input_args = self.pcm_args() if path.lower().endswith(".pcm") else []
+                decoder = subprocess.Popen(
+                    [ffmpeg, "-loglevel", "error", *input_args, "-i", path, *self.pcm_args(), "pipe:1"],
+                    stdout=subprocess.PIPE
+                )
+                shutil.copyfileobj(decoder.stdout, encoder.stdin, block_size)
+                decoder.stdout.close()
+                if decoder.wait() != 0:
+                    raise RuntimeError(f"ffmpeg could not decode {path}")
+        finally:
+            encoder.stdin.close()
+            encoder.wait()
+        if encoder.returncode != 0:
+            raise RuntimeError(f"ffmpeg could not encode {output_path}")
+
+    # NumPy mixing engine
+
+    def decode_pcm(self, path):
+        """Decodes a clip once into a mono int16 array at sample_rate."""
+        if path.lower().endswith(".pcm"):
+            return np.fromfile(path, dtype="<i2")
+        if path.lower().endswith(".wav"):
+            with wave.open(path, "rb") as wav_file:
+                if (wav_file.getframerate(), wav_file.getnchannels(), wav_file.getsampwidth()) == (self.sample_rate, 1, 2):
+                    return np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype="<i2")
+        decoded = subprocess.run(
+            [self.ffmpeg(f"decode {os.path.basename(path)}"), "-loglevel", "error", "-i", path, *self.pcm_args(), "pipe:1"],
+            stdout=subprocess.PIPE, check=True
+        )
+        return np.frombuffer(decoded.stdout, dtype="<i2")
+
+    @staticmethod
+    def trim_silence(samples, threshold_dbfs):
+        """Returns a view without leading/trailing samples below the threshold."""
+        threshold = 32768 * 10 ** (threshold_dbfs / 20)
+        loud = np.flatnonzero(np.abs(samples) > threshold)
+        if loud.size == 0:
+            return samples[:0]
+        return samples[loud[0]:loud[-1] + 1]
+
+    @staticmethod
+    def loudness_gain(samples, target_dbfs):
+        """Linear gain bringing the clip's RMS level to target_dbfs.
+
+        RMS is used as the loudness measure; it levels clips from different
+        voices well enough without a K-weighting filter.
+        """
+        if samples.size == 0:
+            return 1.0
+        rms = np.sqrt(np.mean(np.square(samples, dtype=np.float64)))
+        if rms == 0:
+            return 1.0
+        return 10 ** ((target_dbfs - 20 * np.log10(rms / 32768)) / 20)
+
+    def mix_audio_files(self, output_filename, trim=True, silence_threshold_dbfs=-45.0, target_dbfs=-20.0, crossfade_ms=150):
+        """Combines the audio files with silence trimming, loudness normalization
+        and equal-power crossfades.
+
+        Each clip is decoded once; gain and fades are applied while writing it
+        straight into one preallocated output buffer, which is encoded once.
+        """
+        if not self.audio_files:
+            print("No audio files found to combine.")
+            return
+
+        clips = []
+        for audio_file, _ in self.audio_files:
+            samples = self.decode_pcm(os.path.join(self.directory, audio_file))
+            if trim:
+                samples = self.trim_silence(samples, silence_threshold_dbfs)
+            if samples.size:
+                clips.append((samples, self.loudness_gain(samples, target_dbfs)))
+        if not clips:
+            print("All selected clips are silent.")
+            return
+
+        crossfade = int(self.sample_rate * crossfade_ms / 1000)
+        # A clip may give at most half of itself to its fade-in and the rest to
+        # its fade-out, so short clips never have fades that overlap each other
+        overlaps = []
+        for (previous, _), (current, _) in zip(clips, clips[1:]):
+            previous_fade_in = overlaps[-1] if overlaps else 0
+            overlaps.append(min(crossfade, len(previous) - previous_fade_in, len(current) // 2))
+        output = np.zeros(sum(len(samples) for samples, _ in clips) - sum(overlaps), dtype=np.float32)
+
+        position = 0
+        for index, (samples, gain) in enumerate(clips):
+            fade_in = overlaps[index - 1] if index > 0 else 0
+            fade_out = overlaps[index] if index < len(overlaps) else 0
+            body_end = len(samples) - fade_out
+            # Body: written in place, no temporary copy of the clip
+            np.multiply(samples[fade_in:body_end], gain, out=output[position + fade_in:position + body_end], casting="unsafe")
+            if fade_in:
+                ramp = np.sin(np.linspace(0, np.pi / 2, fade_in, dtype=np.float32))
+                output[position:position + fade_in] += samples[:fade_in] * (gain * ramp)
+            if fade_out:
+                ramp = np.cos(np.linspace(0, np.pi / 2, fade_out, dtype=np.float32))
+                output[position + body_end:position + len(samples)] += samples[body_end:] * (gain * ramp)
+            position += len(samples) - fade_out
+
+        np.clip(output, -32768, 32767, out=output)
+        pcm = output.astype("<i2").tobytes()
+
+        output_path = os.path.join(self.directory, output_filename)
+        output_format = output_filename.split('.')[-1].lower()
+        if output_format == "pcm":
+            with open(output_path, "wb") as output_file:
+                output_file.write(pcm)
+        elif output_format == "wav":
+            with wave.open(output_path, "wb") as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(self.sample_rate)
+                wav_file.writeframes(pcm)
+        else:
+            subprocess.run(
+                [self.ffmpeg(f"encode {output_format}"), "-loglevel", "error", "-y", *self.pcm_args(), "-i", "pipe:0",
+                 output_path],
+                input=pcm, check=True
+            )
+        print(f"Mixed audio file saved as: {output_path}")
+
+    def run(self, output_filename='combined_audio.mp3'):
+        """Runs the process to combine audio files."""
+        self.gather_audio_files()
+        self.combine_audio_files(output_filename)
+
+class AudioLibraryIndex:
+    """SQLite manifest of the clips under audio_clips/<voice>/.
+
+    refresh() stats only the voice directories and rescans one just when its
+    mtime changed (adding, removing or renaming a file updates it), so keeping
+    the index current costs a handful of stat calls per rerun. The page then
+    queries one page of clips at a time instead of listing every directory.
+    """
+    def __init__(self, root, path=None):
+        self.root = root
+        self.path = Path(path or os.getenv("AUDIO_LIBRARY_INDEX", Path.cwd() / "cache" / "audio_library.sqlite"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        # One index serves every session, and a sqlite connection is not safe to use from two threads at once
+        self.lock = threading.Lock()
+        self.connection.executescript(
+            """CREATE TABLE IF NOT EXISTS clips (
+                path TEXT PRIMARY KEY,
+                voice TEXT,
+                filename TEXT,
+                format TEXT,
+                size INTEGER,
+                mtime REAL,
+                duration REAL
+            );
+            CREATE INDEX IF NOT EXISTS clips_voice_format ON clips (voice, format, mtime);
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL);"""
+        )
+
+    @staticmethod
+    def estimate_duration(path, format, size):
+        """Duration in seconds from the file header, without decoding; None if unknown."""
+        try:
+            if format == "wav":
+                with wave.open(path, "rb") as wav_file:
+                    return wav_file.getnframes() / wav_file.getframerate()
+            if format == "pcm":
+                return size / (AudioCombiner.sample_rate * 2)
+            if format == "mp3":
+                with open(path, "rb") as audio_file:
+                    offset = AudioCombiner.id3v2_size(audio_file.read(10))
+                    audio_file.seek(offset)
+                    header = audio_file.read(4)
+                frame_length = AudioCombiner.mp3_frame_length(header)
+                if frame_length:
+                    # OpenAI mp3 output is constant bitrate
+                    mpeg1 = (header[1] >> 3) & 0x03 == 3
+                    bitrates = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320) if mpeg1 else \
+                        (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+                    return (size - offset) * 8 / (bitrates[header[2] >> 4] * 1000)
+        except (OSError, wave.Error, EOFError):
+            pass
+        return None
+
+    def refresh(self):
+        with self.lock:
+            seen_dirs = set()
+            for voice in os.listdir(self.root):
+                voice_dir = os.path.join(self.root, voice)
+                if not os.path.isdir(voice_dir):
+                    continue
+                seen_dirs.add(voice_dir)
+                mtime = os.stat(voice_dir).st_mtime
+                row = self.connection.execute("SELECT mtime FROM dirs WHERE path = ?", (voice_dir,)).fetchone()
+                if row is None or row[0] != mtime:
+                    self.scan(voice, voice_dir)
+                    self.connection.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?)", (voice_dir, mtime))
+
+            for (voice_dir,) in self.connection.execute("SELECT path FROM dirs").fetchall():
+                if voice_dir not in seen_dirs:
+                    self.connection.execute("DELETE FROM dirs WHERE path = ?", (voice_dir,))
+                    self.connection.execute("DELETE FROM clips WHERE path LIKE ?", (os.path.join(voice_dir, "%"),))
+            self.connection.commit()
+
+    def scan(self, voice, voice_dir):
+        known = {
+            path: (size, mtime)
+            for path, size, mtime in self.connection.execute(
+                "SELECT path, size, mtime FROM clips WHERE voice = ?", (voice,)
+            )
+        }
+        present = set()
+        for entry in os.scandir(voice_dir):
+            if not entry.is_file() or "." not in entry.name or entry.name.endswith(".part"):
+                continue
+            stat = entry.stat()
+            present.add(entry.path)
+            if known.get(entry.path) == (stat.st_size, stat.st_mtime):
+                continue
+            format = entry.name.rsplit(".", 1)[-1].lower()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO clips VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry.path, voice, entry.name, format, stat.st_size, stat.st_mtime,
+                 self.estimate_duration(entry.path, format, stat.st_size))
+            )
+        for path in set(known) - present:
+            self.connection.execute("DELETE FROM clips WHERE path = ?", (path,))
+
+    def voices(self, format):
+        """Returns [(voice, clip_count)] for voice directories, including empty ones."""
+        with self.lock:
+            counts = dict(self.connection.execute(
+                "SELECT voice, COUNT(*) FROM clips WHERE format = ? GROUP BY voice", (format,)
+            ).fetchall())
+            voices = sorted(os.path.basename(path) for (path,) in self.connection.execute("SELECT path FROM dirs"))
+        return [(voice, counts.get(voice, 0)) for voice in voices]
+
+    def page(self, voice, format, page, page_size):
+        """Returns one page of clips as (filename, path, size, duration), newest first."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT filename, path, size, duration FROM clips WHERE voice = ? AND format = ? "
+                "ORDER BY mtime DESC LIMIT ? OFFSET ?",
+                (voice, format, page_size, page * page_size)
+            ).fetchall()
+
+def split_text(text, limit):
+    """Splits text into chunks of at most `limit` characters for synthesis.
+
+    Each paragraph becomes its own chunk (so editing one paragraph leaves the
+    other chunks, and their cache entries, untouched). Paragraphs over the limit
+    are split at sentence boundaries, and sentences over it at whitespace.
+    """
+    chunks = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= limit:
+            chunks.append(paragraph)
+            continue
+        current = ""
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            while len(sentence) > limit:
+                cut = sentence.rfind(" ", 0, limit)
+                cut = cut if cut > 0 else limit
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if current and len(current) + 1 + len(sentence) > limit:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+    return chunks
+
+class SpeechCache:
+    """Content-addressed store of synthesized audio.
+
+    Entries are keyed on a hash of (text, model, voice, speed, format). A hit is
+    copied to the requested path instead of calling the API again. The least
+    recently used files are evicted once the cache grows past max_bytes.
+
+    Entries are copies rather than hard links: recency is kept in the entry's
+    own mtime, and touching an inode shared with a library clip would reorder
+    the user's clips.
+    """
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = Path(directory or os.getenv("TTS_CACHE_DIR", Path.cwd() / "cache" / "speech"))
+        self.max_bytes = max_bytes or int(os.getenv("TTS_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Workers finishing the same text at once must not race on the entry or the eviction pass
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, model, voice, speed, format):
+        canonical = json.dumps([text, model, voice, float(speed), format], ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def path(self, key, format):
+        return self.directory / f"{key}.{format}"
+
+    def get(self, key, format):
+        """Returns the cached file for a key, or None."""
+        cached_path = self.path(key, format)
+        if not cached_path.exists():
+            return None
+        os.utime(cached_path)  # mark as recently used
+        return cached_path
+
+    def copy(self, source, target):
+        target = Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Copy under a .part name and rename, so readers never see a partial file
+        fd, partial_path = tempfile.mkstemp(dir=target.parent, suffix=".part")
+        os.close(fd)
+        try:
+            # copyfile, not copy2: the copy is new and gets its own mtime
+            shutil.copyfile(source, partial_path)
+            os.replace(partial_path, target)
+        except BaseException:
+            os.unlink(partial_path)
+            raise
+
+    def put(self, key, format, source):
+        cached_path = self.path(key, format)
+        with self.lock:
+            if not cached_path.exists():
+                self.copy(source, cached_path)
+                self.evict()
+        return cached_path
+
+    def evict(self):
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry) for entry in self.directory.iterdir() if entry.is_file()]
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            entry.unlink()
+            total -= size
+
+# Per-request speech settings. Immutable, so a request in flight never sees
+# another session's model, voice or format change underneath it.
+SpeechSettings = namedtuple("SpeechSettings", ["model", "voice", "format", "speed"],
+                            defaults=("tts-1", "nova", "mp3", 1.0))
+
+class TTSService:
+    """OpenAI speech synthesis shared by every session.
+
+    The service keeps no per-request state: each call takes the text, a
+    SpeechSettings and an output path. The client, the speech cache and the
+    worker pool that synthesizes long texts are shared, so many users can
+    synthesize at once without touching each other's settings or files.
+    """
+    models = {"tts-1":"tts-1", "tts-1-hd":"tts-1-hd"}
+    voices = {"alloy":"alloy", "ash":"ash", "coral":"coral", "echo":"echo", "fable":"fable", "onyx":"onyx", "nova":"nova", "sage":"sage", "shimmer":"shimmer"}
+    formats = {"mp3" : "mp3", "opus" : "opus", "aac" : "aac", "flac" : "flac", "wav" : "wav", "pcm" : "pcm"}
+    languages = {language: language for language in ["Afrikaans","Arabic","Armenian","Azerbaijani","Belarusian","Bosnian","Bulgarian","Catalan","Chinese","Croatian","Czech","Danish","Dutch","English","Estonian","Finnish","French","Galician","German","Greek","Hebrew","Hindi","Hungarian","Icelandic","Indonesian","Italian","Japanese","Kannada","Kazakh","Korean","Latvian","Lithuanian","Macedonian","Malay","Marathi","Maori","Nepali","Norwegian","Persian","Polish","Portuguese","Romanian","Russian","Serbian","Slovak","Slovenian","Spanish","Swahili","Swedish","Tagalog","Tamil","Thai","Turkish","Ukrainian","Urdu","Vietnamese","Welsh"]}
+
+    def __init__(self, audio_clips_dir="content/audio_clips", max_workers=None):
+        # Shared with the chat page so every request reuses the same connections
+        self.client = get_client_pool().get("OpenAI")
+        # Max characters per speech request
+        self.input_limit = int(os.getenv("TTS_INPUT_LIMIT", 4096))
+        self.audio_clips_dir = audio_clips_dir
+        self.speech_cache = SpeechCache()
+        # Chunks of every long text run on this one bounded pool, however many users are synthesizing
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or int(os.getenv("TTS_MAX_WORKERS", 4)),
+                                           thread_name_prefix="tts")
+
+    def output_path(self, settings, directory=None):
+        """A new path under audio_clips/<voice>/ that no other request will use."""
+        directory = Path.cwd() / self.audio_clips_dir / (directory or settings.voice)
+        directory.mkdir(parents=True, exist_ok=True)
+        # Two requests in the same second would share a timestamp, so a random suffix keeps them apart
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        return str(directory / f"{settings.voice}-{settings.model}-{timestamp}-{uuid.uuid4().hex[:8]}.{settings.format}")
+
+    def create_speech(self, text, settings, path=None):
+        if not path:
+            path = self.output_path(settings)
+        # Identical requests reuse the audio already synthesized instead of calling the API
+        key = self.speech_cache.make_key(text, settings.model, settings.voice, settings.speed, settings.format)
+        cached_path = self.speech_cache.get(key, settings.format)
+        if cached_path:
+            self.speech_cache.copy(cached_path, path)
+            return path
+        # Shares the chat's per-model governor, so TTS bursts queue instead of tripping 429s
+        with get_governor().request("OpenAI", settings.model) as permit:
+            response = permit.call(self.client.audio.speech.create, model=settings.model, voice=settings.voice,
+                                   input=text, speed=settings.speed, response_format=settings.format)
+            # Written under a .part name and renamed, so a library refresh never indexes a half-written clip
+            self.write_atomically(path, response.write_to_file)
+        self.speech_cache.put(key, settings.format, path)
+        return path
+
+    def create_long_speech(self, text, settings, path=None):
+        """Synthesizes text of any length into one file.
+
+        The text is split under the API's input limit and the chunks are
+        synthesized concurrently on the shared worker pool, each through the
+        speech cache, then joined in order.
+        """
+        if not path:
+            path = self.output_path(settings)
+        chunks = split_text(text, self.input_limit)
+        if len(chunks) <= 1:
+            return self.create_speech(text, settings, path=path)
+
+        with tempfile.TemporaryDirectory() as chunk_dir:
+            chunk_files = [f"{index:04d}.{settings.format}" for index in range(len(chunks))]
+            futures = [
+                self.executor.submit(self.create_speech, chunk, settings, os.path.join(chunk_dir, chunk_file))
+                for chunk, chunk_file in zip(chunks, chunk_files)
+            ]
+            for future in futures:
+                future.result()
+
+            if settings.format == "pcm":
+                def join(partial_path):
+                    # Headerless samples; joining is plain concatenation
+                    with open(partial_path, "wb") as output:
+                        for chunk_file in chunk_files:
+                            with open(os.path.join(chunk_dir, chunk_file), "rb") as chunk_audio:
+                                shutil.copyfileobj(chunk_audio, output)
+                self.write_atomically(path, join)
+            else:
+                combiner = AudioCombiner(chunk_dir)
+                combiner.audio_files = [(chunk_file, index) for index, chunk_file in enumerate(chunk_files)]
+                combined_filename = f"combined.{settings.format}"
+                combiner.combine_audio_files(combined_filename)
+                self.write_atomically(path, lambda partial_path: shutil.move(os.path.join(chunk_dir, combined_filename),
+                                                                             partial_path))
+        return path
+
+    @staticmethod
+    def write_atomically(path, write):
+        """Calls write(partial_path) and renames the result to path; a failed write leaves nothing behind."""
+        partial_path = f"{path}.part"
+        try:
+            write(partial_path)
+            os.replace(partial_path, path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.unlink(partial_path)
+            raise
+
+    def stream_speech(self, text, settings, path=None, chunk_size=8192):
+        """Yields audio chunks as they arrive while writing them to path.
+
+        The file is written under a temporary name and renamed when complete, so
+        a partial clip never shows up in the library or the cache.
+        """
+        if not path:
+            path = self.output_path(settings)
+        key = self.speech_cache.make_key(text, settings.model, settings.voice, settings.speed, settings.format)
+        cached_path = self.speech_cache.get(key, settings.format)
+        if cached_path:
+            self.speech_cache.copy(cached_path, path)
+            with open(path, "rb") as audio_file:
+                while chunk := audio_file.read(chunk_size):
+                    yield chunk
+            return
+
+        partial_path = f"{path}.part"
+        try:
+            with get_governor().request("OpenAI", settings.model) as permit:
+                # The request is sent on __enter__, so that is what the governor retries
+                response = permit.call(lambda: self.client.audio.speech.with_streaming_response.create(
+                    model=settings.model, voice=settings.voice, input=text, speed=settings.speed,
+                    response_format=settings.format
+                ).__enter__())
+                try:
+                    with open(partial_path, "wb") as audio_file:
+                        for chunk in response.iter_bytes(chunk_size):
+                            audio_file.write(chunk)
+                            yield chunk
+                finally:
+                    response.close()
+            os.replace(partial_path, path)
+        except BaseException:
+            # A failed stream or a consumer that stopped early (GeneratorExit) leaves no .part behind
+            if os.path.exists(partial_path):
+                os.unlink(partial_path)
+            raise
+        self.speech_cache.put(key, settings.format, path)
+
+_tts_service = None
+_tts_service_lock = threading.Lock()
+
+def get_tts_service():
+    global _tts_service
+    with _tts_service_lock:
+        if _tts_service is None:
+            _tts_service = TTSService()
+        return _tts_service
+
+_audio_library_index = None
+_audio_library_index_lock = threading.Lock()
+
+def get_audio_library_index():
+    """The library index over the shared TTS service's clips, opened once per process."""
+    global _audio_library_index
+    with _audio_library_index_lock:
+        if _audio_library_index is None:
+            _audio_library_index = AudioLibraryIndex(get_tts_service().audio_clips_dir)
+        return _audio_library_index
+
+def pcm_to_wav(pcm_bytes, sample_rate=24000):
+    """Wraps raw 16-bit mono PCM (the API's "pcm" format) in a WAV header so browsers can play it."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm_bytes[:len(pcm_bytes) - len(pcm_bytes) % 2])
+    return buffer.getvalue()
+
+def audio_from(data, format, seconds):
+    """Cuts streamed "pcm" or "mp3" audio to start about `seconds` in.
+
+    Returns (playable bytes, their duration in seconds). PCM is cut at a sample
+    and wrapped as WAV; MP3 is cut at the first whole frame from that point, and
+    a frame still being received at the end is left out.
+    """
+    if format == "pcm":
+        tail = data[min(int(seconds * 24000) * 2, len(data)):]
+        tail = tail[:len(tail) - len(tail) % 2]
+        return pcm_to_wav(tail), len(tail) / 48000
+    offset = AudioCombiner.id3v2_size(data[:10])
+    start = start_seconds = None
+    elapsed = 0.0
+    while offset + 4 <= len(data):
+        header = data[offset:offset + 4]
+        length = AudioCombiner.mp3_frame_length(header)
+        if not length or offset + length > len(data):
+            break
+        if start is None and elapsed >= seconds:
+            start, start_seconds = offset, elapsed
+        elapsed += AudioCombiner.mp3_frame_duration(header)
+        offset += length
+    if start is None:
+        return b"", 0.0
+    return bytes(data[start:offset]), elapsed - start_seconds